@@ -0,0 +1,144 @@
+"""Weather alert subscriptions with batched threshold evaluation."""
+import os
+import sqlite3
+import threading
+import numpy as np
+
+# Bit positions of each alert in subscription and state masks
+ALERT_TYPES = ("tempcold", "temphot", "humidity", "wind_speed", "uv_index", "aqi")
+ALL_ALERTS = (1 << len(ALERT_TYPES)) - 1
+ALERT_BITS = 1 << np.arange(len(ALERT_TYPES), dtype=np.int64)
+
+def parse_alert_mask(names):
+    """Turn a comma separated list of alert types (or 'all') into a bit mask."""
+    names = [name.strip().lower() for name in names.split(",") if name.strip()]
+    if not names or "all" in names:
+        return ALL_ALERTS
+    mask = 0
+    for name in names:
+        if name not in ALERT_TYPES:
+            raise ValueError(f"Unknown alert type '{name}'")
+        mask |= 1 << ALERT_TYPES.index(name)
+    return mask
+
+def alert_names(mask):
+    """Return the alert types set in mask."""
+    return [name for bit, name in enumerate(ALERT_TYPES) if mask & (1 << bit)]
+
+def select_subscriptions(subscriptions, keep):
+    """Return the rows of load_arrays() output where the boolean array keep is set."""
+    return {name: [value for value, kept in zip(column, keep) if kept] \
+        if isinstance(column, list) else column[keep] for name, column in subscriptions.items()}
+
+class SubscriptionStore:
+    """Channel subscriptions persisted in SQLite.
+
+    Every method touches the database, so call them from a worker thread.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, city TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, "
+            "alert_mask INTEGER NOT NULL, state INTEGER NOT NULL DEFAULT 0, "
+            "UNIQUE (channel_id, city))"
+        )
+        self._conn.commit()
+
+    def add(self, channel_id, user_id, city, lat, lon, mask):
+        """Create or replace the subscription of a channel to a city."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO subscriptions (channel_id, user_id, city, lat, lon, alert_mask) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (channel_id, city) DO UPDATE SET "
+                "user_id = excluded.user_id, lat = excluded.lat, lon = excluded.lon, "
+                "alert_mask = excluded.alert_mask, state = 0",
+                (channel_id, user_id, city, lat, lon, mask)
+            )
+            self._conn.commit()
+
+    def remove(self, channel_id, city):
+        """Delete a channel's subscription to a city; returns whether one existed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM subscriptions WHERE channel_id = ? AND city = ? COLLATE NOCASE",
+                (channel_id, city)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def for_channel(self, channel_id):
+        """Return (city, alert_mask) for every subscription in a channel."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT city, alert_mask FROM subscriptions WHERE channel_id = ? ORDER BY city",
+                (channel_id,)
+            ).fetchall()
+
+    def load_arrays(self):
+        """Return every subscription as column arrays for batch evaluation."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, channel_id, city, lat, lon, alert_mask, state FROM subscriptions"
+            ).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * 7
+        return {
+            "id": np.array(columns[0], dtype=np.int64),
+            "channel_id": np.array(columns[1], dtype=np.int64),
+            "city": list(columns[2]),
+            "lat": np.array(columns[3], dtype=float),
+            "lon": np.array(columns[4], dtype=float),
+            "alert_mask": np.array(columns[5], dtype=np.int64),
+            "state": np.array(columns[6], dtype=np.int64)
+        }
+
+    def update_states(self, ids, states):
+        """Persist new alert states for the given subscription ids."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE subscriptions SET state = ? WHERE id = ?",
+                [(int(state), int(sub_id)) for sub_id, state in zip(ids, states)]
+            )
+            self._conn.commit()
+
+class AlertEvaluator:
+    """Evaluates every polled location against the configured level thresholds at once."""
+
+    def __init__(self, config, aqi_min=3):
+        self.cold_max = config["temperature_levels"]["cold"]["max"]
+        self.hot_min = config["temperature_levels"]["hot"]["min"]
+        self.humid_max = config["humidity_levels"]["humid"]["max"]
+        self.wind_min = config["wind_levels"]["strong_wind"]["min"]
+        self.uv_min = config["uv_levels"]["high"]["min"]
+        self.aqi_min = aqi_min
+
+    def evaluate(self, temp, humidity, wind, uv, aqi):
+        """Return the active-alert bit mask of each location; NaN readings never alert."""
+        with np.errstate(invalid='ignore'):
+            conditions = np.column_stack((
+                temp < self.cold_max,
+                temp > self.hot_min,
+                humidity > self.humid_max,
+                wind > self.wind_min,
+                uv > self.uv_min,
+                aqi >= self.aqi_min
+            ))
+        return conditions.astype(np.int64) @ ALERT_BITS
+
+    @staticmethod
+    def transitions(location_masks, location_index, valid, wanted, previous):
+        """Return (raised, new_state) per subscription.
+
+        raised holds the alerts that just became active; subscriptions whose location
+        could not be polled keep their previous state so they don't re-alert later.
+        """
+        current = location_masks[location_index] & wanted
+        new_state = np.where(valid[location_index], current, previous)
+        raised = new_state & ~previous
+        return raised, new_state
@@ -0,0 +1,248 @@
+"""Offline benchmark of the SKYWATCHER command handlers.
+
+Serves recorded OpenWeather payloads from a local stub server, drives the slash
+command handlers through a fake interaction and reports throughput, p50/p99 latency
+and peak memory per command. No Discord token or API key is needed.
+
+    python bench/run_bench.py --iterations 200 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import datetime
+import shutil
+import resource
+import tempfile
+import importlib
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import FIXTURES_DIR, start_stub_server  # pylint: disable=wrong-import-position
+
+COMMANDS = ("weather", "hourly", "daily", "compare", "hurricane", "season", "nearby")
+
+class FakeResponse:
+    """Records what a handler sends through interaction.response."""
+
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self._interaction.record(content, **kwargs)
+
+    async def defer(self, **_kwargs):
+        self._done = True
+
+class FakeFollowup:
+    """Records what a handler sends through interaction.followup."""
+
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self._interaction.record(content, **kwargs)
+
+class FakeInteraction:
+    """Just enough of discord.Interaction for the command handlers."""
+
+    def __init__(self, command_name, channel_id=1, user_id=1):
+        self.command = SimpleNamespace(name=command_name, qualified_name=command_name)
+        self.channel_id = channel_id
+        self.user = SimpleNamespace(id=user_id, name="bench")
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+        self.bytes_sent = 0
+
+    def record(self, content=None, **kwargs):
+        """Keep the message and drain any attached files like an upload would."""
+        attached = list(kwargs.get("attachments") or [])
+        if kwargs.get("file") is not None:
+            attached.append(kwargs["file"])
+        for file in attached:
+            self.bytes_sent += len(file.fp.read())
+        self.messages.append((content, kwargs.get("embed")))
+
+    async def edit_original_response(self, content=None, **kwargs):
+        self.record(content, **kwargs)
+
+def write_config(data_dir):
+    """Copy config.json with every on-disk path moved into data_dir."""
+    with open(os.path.join(ROOT, "config.json"), 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    config["geocode"]["db_path"] = os.path.join(data_dir, "geocode.sqlite3")
+    config["alerts"]["db_path"] = os.path.join(data_dir, "subscriptions.sqlite3")
+    config["storms"]["snapshot_dir"] = os.path.join(data_dir, "north_atlantic")
+    config["storms"]["track_cache_dir"] = os.path.join(data_dir, "tracks")
+    config["shared_cache"]["path"] = os.path.join(data_dir, "shared_cache.sqlite3")
+    config["metrics"]["port"] = 0
+    # The stub has no quota, so don't let the client-side budget skew the numbers
+    config["rate_limit"]["per_minute"] = 10**9
+    config["rate_limit"]["per_day"] = 10**9
+    config["metrics"]["dump_path"] = ""
+    path = os.path.join(data_dir, "config.json")
+    with open(path, 'w', encoding='utf-8') as config_file:
+        json.dump(config, config_file)
+    return path
+
+def load_storms(bot, hurdat_path):
+    """Load the archive from a local HURDAT2 file instead of downloading it."""
+    import tropycal.tracks as tracks  # pylint: disable=import-outside-toplevel
+    from storms import StormIndex, TrackPoints  # pylint: disable=import-outside-toplevel
+    dataset = tracks.TrackDataset(basin='north_atlantic', atlantic_url=hurdat_path)
+    points = TrackPoints.from_storm_data(dataset.data)
+    bot.storm_archive.index = StormIndex(points)
+    bot.storm_archive.points = points
+
+def clear_caches(bot):
+    """Forget every cached response, chart and track image (the geocode index is kept)."""
+    bot.weather_cache.clear()
+    bot.forecast_tables.clear()
+    bot.chart_cache.clear()
+    if bot.shared_cache is not None:
+        bot.shared_cache.clear()
+    for name in os.listdir(bot.track_cache.directory):
+        os.remove(os.path.join(bot.track_cache.directory, name))
+
+def handler_for(bot, command, args):
+    """Return a coroutine function running one invocation of command."""
+    if command == "weather":
+        return lambda interaction: bot.weather.callback(interaction, city=args.city)
+    if command == "hourly":
+        return lambda interaction: bot.send_hourly_forecast(interaction, args.city)
+    if command == "daily":
+        return lambda interaction: bot.send_daily_forecast(interaction, args.city)
+    if command == "compare":
+        return lambda interaction: bot.compare.callback(interaction, cities=args.cities)
+    if command == "season":
+        return lambda interaction: bot.season.callback(interaction, years=args.seasons)
+    if command == "nearby":
+        return lambda interaction: bot.nearby.callback(interaction, city=args.city,
+                                                       radius_km=args.radius)
+    return lambda interaction: bot.hurricane.callback(interaction, stormname_year=args.storm)
+
+async def bench_command(bot, command, args):
+    """Run one command iterations times at the given concurrency and summarise it."""
+    run = handler_for(bot, command, args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+    bytes_sent = 0
+
+    async def one():
+        nonlocal errors, bytes_sent
+        async with semaphore:
+            if args.cold:
+                clear_caches(bot)
+            interaction = FakeInteraction(command)
+            token = bot.metrics.current_command.set(command)
+            started = time.perf_counter()
+            try:
+                await run(interaction)
+            except Exception:  # pylint: disable=broad-except
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+                bot.metrics.current_command.reset(token)
+            bytes_sent += interaction.bytes_sent
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.iterations)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "command": command,
+        "calls": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "peak_heap_mb": peak / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "kb_sent": bytes_sent / 1024
+    }
+
+async def main(args):
+    runner, base_url = await start_stub_server(latency=args.latency)
+    data_dir = tempfile.mkdtemp(prefix="skywatcher-bench-")
+    os.environ["SKYWATCHER_CONFIG"] = write_config(data_dir)
+    os.environ["OPENWEATHER_BASE_URL"] = base_url
+    os.environ.setdefault("weatherapi", "bench")
+
+    # bot reads its configuration at import time, so import it only now
+    bot = importlib.import_module("bot")
+    await bot.weather_client.start()
+    bot.render_pool.start()
+    if {"hurricane", "season", "nearby"} & set(args.commands):
+        load_storms(bot, args.hurdat)
+
+    tracemalloc.start()
+    results = []
+    try:
+        for command in args.commands:
+            # One untimed call to spin up render workers and fill the geocode index; a
+            # failing command is still benchmarked so its errors show up in the table
+            try:
+                await handler_for(bot, command, args)(FakeInteraction(command))
+            except Exception:  # pylint: disable=broad-except
+                pass
+            results.append(await bench_command(bot, command, args))
+    finally:
+        tracemalloc.stop()
+        await bot.weather_client.close()
+        bot.render_pool.shutdown()
+        await runner.cleanup()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    header = f"{'command':<10} {'calls':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} " \
+             f"{'p99 ms':>8} {'heap MB':>8} {'rss MB':>8} {'sent KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(f"{result['command']:<10} {result['calls']:>6} {result['errors']:>6} "
+              f"{result['throughput']:>8.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['peak_heap_mb']:>8.1f} {result['max_rss_mb']:>8.1f} "
+              f"{result['kb_sent']:>9.0f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50, help="calls per command")
+    parser.add_argument("--concurrency", type=int, default=4, help="calls in flight at once")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS))
+    parser.add_argument("--city", default="Bangkok")
+    parser.add_argument("--cities", default="Bangkok, London, Tokyo, Lima, Oslo",
+                        help="comma separated cities for the compare command")
+    parser.add_argument("--storm", default="Dorian 2019")
+    parser.add_argument("--seasons", default="2018-2020", help="seasons for /season")
+    parser.add_argument("--radius", type=int, default=1000, help="radius in km for /nearby")
+    parser.add_argument("--hurdat", default=os.path.join(FIXTURES_DIR, "hurdat2_sample.txt"),
+                        help="HURDAT2 file used for the storm commands")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="artificial stub server latency in seconds")
+    parser.add_argument("--cold", action="store_true",
+                        help="clear response, chart and track caches before every call")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,67 @@
+"""Local stand-in for the OpenWeather API that replays recorded payloads."""
+import os
+import json
+import zlib
+import asyncio
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Request path -> recorded payload served for it
+ROUTES = {
+    "/geo/1.0/direct": "direct.json",
+    "/data/2.5/weather": "weather.json",
+    "/data/2.5/forecast": "forecast.json",
+    "/data/2.5/uvi": "uvi.json",
+    "/data/2.5/air_pollution": "air_pollution.json"
+}
+
+def geocode_payload(template, query):
+    """Answer a geocode query with the recorded entry renamed and moved per query.
+
+    Distinct cities then land on distinct coordinates, as they would upstream, instead
+    of all sharing one cache entry.
+    """
+    if not query or query.lower() == template[0]["name"].lower():
+        return template
+    offset = zlib.crc32(query.lower().encode('utf-8'))
+    entry = dict(template[0], name=query.title(), local_names={"en": query.title()},
+                 lat=round(offset % 12000 / 100 - 60, 4),
+                 lon=round(offset // 12000 % 36000 / 100 - 180, 4))
+    return [entry]
+
+def create_app(fixtures_dir=FIXTURES_DIR, latency=0.0):
+    """Build an app serving every fixture, each response delayed by latency seconds."""
+    payloads = {}
+    for path, name in ROUTES.items():
+        with open(os.path.join(fixtures_dir, name), 'r', encoding='utf-8') as fixture_file:
+            payloads[path] = json.load(fixture_file)
+    encoded = {path: json.dumps(payload) for path, payload in payloads.items()}
+
+    async def handle(request):
+        if latency:
+            await asyncio.sleep(latency)
+        request.app["hits"][request.path] += 1
+        if request.path == "/geo/1.0/direct":
+            text = json.dumps(geocode_payload(payloads[request.path], request.query.get("q", "")))
+        else:
+            text = encoded[request.path]
+        return web.Response(text=text, content_type="application/json")
+
+    app = web.Application()
+    app["hits"] = {path: 0 for path in ROUTES}
+    for path in ROUTES:
+        app.router.add_get(path, handle)
+    return app
+
+async def start_stub_server(host="127.0.0.1", port=0, latency=0.0):
+    """Start the stub server and return (runner, base_url)."""
+    runner = web.AppRunner(create_app(latency=latency), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+    return runner, f"http://{host}:{bound_port}"
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="127.0.0.1", port=8089)
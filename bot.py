@@ -1,24 +1,36 @@
 """SKYWATCHER"""
+import gc
 import os
+import io
+import re
+import math
+import asyncio
 import logging
 import random
 import datetime
 import json
+import numpy as np
 import discord
-import requests
-import matplotlib.pyplot as plt
-import tropycal.tracks as tracks
+from discord import app_commands
 from discord.ext import commands, tasks
 from discord.ui import Button, View
 from dotenv import load_dotenv
-
-# Load configuration
-with open('config.json', 'r', encoding='utf-8') as config_file:
-    config = json.load(config_file)
-
-weather_emojis = config["weather_emojis"]
-custom_cities = config["custom_cities"]
-statuses = config["statuses"]
+from weather_client import WeatherClient, SingleFlight, RateLimiter, RateLimitExceeded
+from cache import TTLCache, ByteBudgetCache, DiskImageCache
+from geocode_index import GeocodeIndex
+from shared_cache import SharedCache
+import charts
+from charts import RenderPool, RenderQueueFull
+from storms import CATEGORIES, StormArchive
+from forecast import ForecastTable
+from config_service import ConfigService, normalize_city
+import metrics
+import memory
+from memory import MemoryMonitor
+from prefetch import LocationTracker
+from responses import ResponsePipeline
+from alerts import ALERT_TYPES, SubscriptionStore, alert_names, parse_alert_mask, \
+    select_subscriptions
 
 load_dotenv('token.env')
 tokencode = os.getenv('token')
@@ -31,74 +43,421 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logger.addHandler(console_handler)
 
+# Load configuration. Emojis, custom cities, statuses, thresholds and messages are
+# re-read from settings.current per request and reload while the bot runs; the
+# infrastructure sections below are read once at startup.
+settings = ConfigService(os.getenv('SKYWATCHER_CONFIG', 'config.json'))
+config = settings.current.raw
+settings.poll_seconds = config.get("reload", {}).get("poll_seconds", 5)
+
+metrics_config = config.get("metrics", {})
+
+# Shards served by this process; several processes can split one bot's shards between them
+shard_config = config.get("sharding", {})
+shard_count = int(os.getenv('SKYWATCHER_SHARD_COUNT', '0')) or shard_config.get("shard_count")
+shard_ids = [int(shard_id) for shard_id in os.getenv('SKYWATCHER_SHARD_IDS', '').split(',') \
+    if shard_id.strip()] or list(shard_config.get("shard_ids") or []) or None
+# Syncing commands, pre-rendering and metric dumps only need to happen in one process
+primary_process = not shard_ids or 0 in shard_ids
+# Every process spends from the same API key, so each gets its share of the budget
+budget_share = len(shard_ids) / shard_count if shard_ids and shard_count else 1
+
+# Shared non-blocking HTTP session for every OpenWeather call
+http_config = config.get("http", {})
+api_base = os.getenv('OPENWEATHER_BASE_URL',
+                     http_config.get("base_url", "http://api.openweathermap.org"))
+rate_config = config.get("rate_limit", {})
+rate_limiter = RateLimiter(
+    per_minute=max(1, int(rate_config.get("per_minute", 60) * budget_share)),
+    per_day=max(1, int(rate_config.get("per_day", 30000) * budget_share))
+)
+request_priorities = rate_config.get("priorities", {})
+weather_client = WeatherClient(
+    pool_size=http_config.get("pool_size", 100),
+    per_host_limit=http_config.get("per_host_limit", 20),
+    timeout=http_config.get("timeout", 10),
+    limiter=rate_limiter,
+    max_queue_wait=rate_config.get("max_queue_wait", 5)
+)
+rate_limited_message = "The weather service is busy right now. Please try again in a minute."
+source_timeouts = http_config.get("source_timeouts", {})
+
+# Worker processes for matplotlib/Cartopy rendering
+render_config = config.get("render", {})
+# Image format, resolution and compression of every chart and track map
+render_output = {
+    "image_format": render_config.get("format", "png"),
+    "dpi": render_config.get("dpi"),
+    "optimize": render_config.get("optimize", False),
+    "quality": render_config.get("quality", 80)
+}
+charts.configure_output(**render_output)
+image_extension = render_output["image_format"]
+render_pool = RenderPool(
+    workers=render_config.get("workers"),
+    max_pending=render_config.get("max_pending", 16),
+    queue_timeout=render_config.get("queue_timeout", 10),
+    output=render_output
+)
+render_busy_message = "The chart renderer is busy right now. Please try again in a moment."
+chart_cache = ByteBudgetCache(max_bytes=render_config.get("cache_max_mb", 64) * 1024 * 1024)
+
+async def render_chart(func, *args):
+    """Render a chart in the worker pool, reusing cached bytes for identical input series."""
+    # Output settings are part of the key, as the shared cache outlives a config change
+    key = charts.chart_digest(func, render_output, *args)
+    image_bytes = chart_cache.get(key)
+    if image_bytes is not None:
+        return image_bytes
+    if shared_cache is not None:
+        entry = await asyncio.to_thread(shared_cache.get, "chart", key)
+        if entry is not None:
+            chart_cache.set(key, entry[0])
+            return entry[0]
+    with metrics.stage("render"):
+        image_bytes = await render_pool.render(func, *args)
+    chart_cache.set(key, image_bytes)
+    if shared_cache is not None:
+        await asyncio.to_thread(shared_cache.set, "chart", key, image_bytes,
+                                shared_config.get("chart_ttl", 1800))
+    return image_bytes
+
+def chart_file(image_bytes, *name_parts):
+    """Wrap rendered image bytes as an in-memory attachment with a URL-safe filename."""
+    stem = "_".join(re.sub(r'[^A-Za-z0-9]+', '-', str(part)).strip('-') for part in name_parts)
+    return discord.File(io.BytesIO(image_bytes), filename=f"{stem or 'chart'}.{image_extension}")
+
+# Every slow command defers at once and streams its results through a ResponsePipeline
+response_config = config.get("responses", {})
+
+def deferred(interaction):
+    """Start the response pipeline for an interaction with its command's deadline."""
+    timeouts = response_config.get("timeouts", {})
+    return ResponsePipeline(
+        interaction,
+        timeout=timeouts.get(metrics.current_command.get(), timeouts.get("default", 60)),
+        slow_seconds=response_config.get("slow_seconds", 5)
+    )
+
+async def send_with_image(response, embed, image, *name_parts):
+    """Send embed with the image produced by the awaitable image.
+
+    If the image isn't ready within response_config's text_first_after seconds, the
+    embed goes out on its own and the image is attached to it once it's done.
+    """
+    image_task = asyncio.ensure_future(image)
+    try:
+        done, _ = await asyncio.wait({image_task}, timeout=response_config.get(
+            "text_first_after", 0.5))
+        if not done:
+            await response.send(embed=embed)
+        try:
+            image_bytes = await image_task
+        except RenderQueueFull:
+            if response.sent:
+                await response.send(render_busy_message)
+            else:
+                await response.send(render_busy_message, embed=embed)
+            return
+    finally:
+        image_task.cancel()
+    await response.attach(chart_file(image_bytes, *name_parts), embed)
+
+class InstrumentedTree(app_commands.CommandTree):
+    """Command tree that labels each slash command's stage timings with its name."""
+
+    async def interaction_check(self, interaction):
+        if interaction.command is not None:
+            metrics.current_command.set(interaction.command.name)
+        return True
+
+class SkywatcherBot(commands.AutoShardedBot):
+    """Bot that owns the lifetime of the shared OpenWeather session and metrics endpoint."""
+
+    metrics_runner = None
+    lag_monitor = None
+
+    async def setup_hook(self):
+        settings.start()
+        await weather_client.start()
+        render_pool.start()
+        self.lag_monitor = asyncio.create_task(metrics.measure_event_loop_lag())
+        if metrics_config.get("port"):
+            # Processes on one host each listen on the port offset by their first shard
+            self.metrics_runner = await metrics.start_http_server(
+                metrics_config.get("host", "127.0.0.1"),
+                metrics_config["port"] + (min(shard_ids) if shard_ids else 0)
+            )
+
+    async def close(self):
+        settings.stop()
+        await weather_client.close()
+        if shared_cache is not None:
+            shared_cache.close()
+        render_pool.shutdown()
+        if self.lag_monitor is not None:
+            self.lag_monitor.cancel()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+
 # Set up intents
 intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
-client = commands.Bot(command_prefix='!', intents=intents)
+client = SkywatcherBot(command_prefix='!', intents=intents, tree_cls=InstrumentedTree,
+                       shard_count=shard_count, shard_ids=shard_ids)
+
+# Response cache keyed by endpoint and rounded coordinates
+cache_config = config.get("cache", {})
+cache_ttls = cache_config.get("ttl", {})
+coord_precision = cache_config.get("coord_precision", 2)
+weather_cache = TTLCache(max_entries=cache_config.get("max_entries", 1024))
+forecast_tables = TTLCache(max_entries=cache_config.get("max_entries", 1024))
+in_flight = SingleFlight()
+
+# Cache shared with the other shard processes so scaling out doesn't multiply API calls
+shared_config = config.get("shared_cache", {})
+shared_cache = SharedCache(
+    shared_config.get("path", "data/shared_cache.sqlite3"),
+    busy_timeout=shared_config.get("busy_timeout", 5)
+) if shared_config.get("enabled", True) else None
+lease_seconds = shared_config.get("lease_seconds", 10)
+lease_poll = shared_config.get("lease_poll", 0.1)
+
+# Local geocoding index so repeat city lookups skip the network
+geocode_config = config.get("geocode", {})
+geocode_index = GeocodeIndex(
+    geocode_config.get("db_path", "data/geocode.sqlite3"),
+    negative_ttl=geocode_config.get("negative_ttl", 86400)
+)
+
+# Popularity of each location, so the prefetcher knows which ones to keep warm
+prefetch_config = config.get("prefetch", {})
+location_tracker = LocationTracker(
+    half_life=prefetch_config.get("half_life_minutes", 60) * 60,
+    precision=coord_precision
+)
+
+def weather_cache_key(url, params):
+    """Build a cache key from the endpoint and rounded lat/lon, or None if not cacheable."""
+    endpoint = url.rsplit('/', 1)[-1]
+    if endpoint not in cache_ttls or 'lat' not in params or 'lon' not in params:
+        return None
+    return (
+        endpoint,
+        round(float(params['lat']), coord_precision),
+        round(float(params['lon']), coord_precision),
+        params.get('units')
+    )
 
-# API call helper with error handling
-def get_weather_data(url, params):
-    """Fetch data from a weather API endpoint with given params and error handling."""
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        logger.error("HTTP error occurred: %s", http_err)
-    except requests.exceptions.RequestException as req_err:
-        logger.error("Request error occurred: %s", req_err)
-    return None
-
-def get_level(value, levels):
-    """Determine level based on configuration thresholds."""
-    for _, bounds in levels.items():
-        min_val = bounds.get('min', float('-inf'))
-        max_val = bounds.get('max', float('inf'))
-        if min_val <= value <= max_val:
-            return bounds['description']
-    return "Unknown"
-
-def get_humidity_level(humidity):
-    """Determine humidity level based on configuration."""
-    levels = config["humidity_levels"]
-    if humidity <= levels["dry"]["max"]:
-        return levels["dry"]["description"]
-    elif humidity <= levels["comfortable"]["max"]:
-        return levels["comfortable"]["description"]
-    elif humidity <= levels["humid"]["max"]:
-        return levels["humid"]["description"]
-    else:
-        return levels["very_humid"]["description"]
+async def get_shared_weather(key, allow_stale=False, min_ttl=0):
+    """Return (payload, seconds_left) stored by any shard process, or None.
 
-def get_wind_level(wind_speed):
-    """Determine wind level based on configuration."""
-    return get_level(wind_speed, config["wind_levels"])
+    Entries expiring within min_ttl seconds count as missing unless allow_stale is set.
+    """
+    entry = await asyncio.to_thread(shared_cache.get, "weather", key, allow_stale)
+    if entry is None or (not allow_stale and entry[1] <= min_ttl):
+        return None
+    return json.loads(entry[0]), entry[1]
+
+async def get_stale_weather(key):
+    """Return an expired payload from the local or shared cache, or None."""
+    stale = weather_cache.get_stale(key)
+    if stale is None and shared_cache is not None:
+        entry = await get_shared_weather(key, allow_stale=True)
+        stale = entry[0] if entry is not None else None
+    return stale
+
+async def fetch_shared(key, fetch_upstream, min_ttl=0):
+    """Return (payload, ttl), calling upstream at most once across every shard process.
+
+    The process that wins the lease on key fetches and publishes the payload; the others
+    wait for it and only fall back to their own call if the lease holder gives up. Shared
+    entries expiring within min_ttl seconds are fetched again.
+    """
+    ttl = cache_ttls[key[0]]
+    entry = await get_shared_weather(key, min_ttl=min_ttl)
+    if entry is not None:
+        return entry
+    if await asyncio.to_thread(shared_cache.try_lease, "weather", key, lease_seconds):
+        try:
+            data = await fetch_upstream()
+            if data is not None:
+                await asyncio.to_thread(shared_cache.set, "weather", key,
+                                        json.dumps(data).encode('utf-8'), ttl)
+            return data, ttl
+        finally:
+            await asyncio.to_thread(shared_cache.release, "weather", key)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lease_seconds
+    while loop.time() < deadline:
+        await asyncio.sleep(lease_poll)
+        entry = await get_shared_weather(key, min_ttl=min_ttl)
+        if entry is not None:
+            return entry
+        if not await asyncio.to_thread(shared_cache.leased, "weather", key):
+            break
+    return await fetch_upstream(), ttl
+
+async def store_weather(key, fetch_upstream, min_ttl=0):
+    """Fetch a cacheable payload, through the shared cache if enabled, and cache it locally."""
+    if shared_cache is not None:
+        data, ttl = await fetch_shared(key, fetch_upstream, min_ttl)
+    else:
+        data, ttl = await fetch_upstream(), cache_ttls[key[0]]
+    if data is not None:
+        weather_cache.set(key, data, ttl)
+    return data
 
-def get_uv_level(uv_index):
-    """Determine UV level based on configuration."""
-    return get_level(uv_index, config["uv_levels"])
+# API call helper with error handling
+async def get_weather_data(url, params, priority=None):
+    """Fetch data from a weather API endpoint with given params and error handling.
 
-def get_rain_level(rain_amount):
-    """Determine rain level based on configuration."""
-    return get_level(rain_amount, config["rain_levels"])
+    priority overrides the endpoint's rate limiter priority, for background callers.
+    """
+    key = weather_cache_key(url, params)
+    if key is not None:
+        cached = weather_cache.get(key)
+        if cached is not None:
+            return cached
+        # Slightly old data beats queueing for a token when the API budget is tight
+        if rate_limiter.would_wait():
+            stale = await get_stale_weather(key)
+            if stale is not None:
+                return stale
+
+    endpoint = url.rsplit('/', 1)[-1]
+    if priority is None:
+        priority = request_priorities.get(endpoint, 1)
+
+    async def fetch_upstream():
+        with metrics.stage(f"fetch_{endpoint}"):
+            return await weather_client.get_json(url, params, priority)
+
+    async def fetch():
+        if key is None:
+            return await fetch_upstream()
+        return await store_weather(key, fetch_upstream)
+
+    # Identical requests already on the wire share that call instead of starting another
+    flight_key = key if key is not None else \
+        (url, tuple(sorted((name, value) for name, value in params.items() if name != 'appid')))
+    try:
+        return await in_flight.run(flight_key, fetch)
+    except RateLimitExceeded:
+        stale = await get_stale_weather(key) if key is not None else None
+        if stale is None:
+            raise
+        logger.warning("Rate limited, serving stale %s data", endpoint)
+        return stale
+
+async def resolve_city(city):
+    """Resolve a city name to (lat, lon, name, country), or None if it cannot be found.
+
+    Every resolved location counts towards its popularity for the prefetcher.
+    """
+    location = await lookup_city(city)
+    if location is not None:
+        location_tracker.record(*location[:3])
+    return location
+
+async def lookup_city(city):
+    """Resolve a city name without counting the request."""
+    custom_location = settings.current.custom_cities.get(normalize_city(city))
+    if custom_location is not None:
+        lat, lon, name = custom_location
+        return lat, lon, name, "Custom Location"
+
+    # Repeat lookups are answered from memory; only a miss pays for a thread and disk read
+    cached = geocode_index.cached(city)
+    known, location = cached if cached is not None else \
+        await asyncio.to_thread(geocode_index.lookup, city)
+    if known:
+        return location
+
+    geocode_url = f"{api_base}/geo/1.0/direct"
+    geocode_params = {'q': city, 'appid': weather_api_key, 'limit': 1}
+    with metrics.stage("geocode"):
+        geocode_data = await get_weather_data(geocode_url, geocode_params)
+    if geocode_data is None:
+        # Transient failure, so don't remember it as a missing city
+        return None
+
+    location = None
+    if geocode_data:
+        location = (geocode_data[0]['lat'], geocode_data[0]['lon'], geocode_data[0]['name'],
+                    geocode_data[0].get('country', 'Unknown'))
+    await asyncio.to_thread(geocode_index.store, city, location)
+    return location
+
+async def get_forecast_table(lat, lon):
+    """Fetch the 3-hour forecast and return it parsed into a ForecastTable, or None."""
+    base_url = f"{api_base}/data/2.5/forecast"
+    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+    data = await get_weather_data(base_url, params)
+    if not data:
+        return None
+    return forecast_table(weather_cache_key(base_url, params), data)
+
+def forecast_table(key, data):
+    """Parse a forecast payload into a ForecastTable, reusing the one parsed for key."""
+    # Reuse the parsed table for as long as the same cached payload is being served
+    entry = forecast_tables.get(key) if key is not None else None
+    if entry is not None and entry[0] is data:
+        return entry[1]
+    table = ForecastTable(data)
+    if key is not None:
+        forecast_tables.set(key, (data, table), cache_ttls[key[0]])
+    return table
+
+async def fetch_with_timeout(url, params, timeout, optional=False, priority=None):
+    """Fetch data with a per-source deadline, degrading to None if the source is too slow.
+
+    Optional sources also degrade to None when the API budget is exhausted.
+    """
+    try:
+        return await asyncio.wait_for(get_weather_data(url, params, priority), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Timed out after %ss waiting for %s", timeout, url)
+        return None
+    except RateLimitExceeded:
+        if not optional:
+            raise
+        return None
 
 @tasks.loop(minutes=1.0)
 async def status_task():
     """Update bot status randomly from a list of statuses."""
-    await client.change_presence(activity=discord.Game(random.choice(statuses)))
+    await client.change_presence(activity=discord.Game(random.choice(settings.current.statuses)))
 
 @client.event
 async def on_ready():
     """Bot ready event handler."""
-    logger.info("Bot is ready.")
-    await client.tree.sync()
-    status_task.start()
+    logger.info("Bot is ready (shards %s of %s).", shard_ids or "all", client.shard_count)
+    if primary_process:
+        await client.tree.sync()
+    if not status_task.is_running():
+        status_task.start()
+    storm_archive.start()
+    if primary_process and not prerender_tracks_task.is_running():
+        prerender_tracks_task.start()
+    if not alerts_task.is_running():
+        alerts_task.start()
+    if primary_process and metrics_config.get("dump_path") and not metrics_dump_task.is_running():
+        metrics_dump_task.start()
+    if primary_process and shared_cache is not None and not shared_cache_purge_task.is_running():
+        shared_cache_purge_task.start()
+    if not memory_monitor_task.is_running():
+        memory_monitor_task.start()
+    if prefetch_config.get("enabled", True) and not prefetch_task.is_running():
+        prefetch_task.start()
 
 @client.tree.command()
 async def custom_city(interaction):
     """Displays available custom cities."""
-    cities_list = "\n".join([city.title() for city in config["custom_cities"]])
+    cities_list = "\n".join([name for _, _, name in settings.current.custom_cities.values()])
     embed = discord.Embed(
         title="Available Custom Cities",
         description=cities_list,
@@ -110,7 +469,7 @@ async def custom_city(interaction):
 async def cmds(interaction):
     """Displays available bot commands."""
     commands_list = "\n".join([f"!{command} - {desc}" for command, desc in \
-config["commands"].items()])
+settings.current.commands])
     embed = discord.Embed(
         title="Available Commands",
         description=commands_list,
@@ -121,509 +480,986 @@ config["commands"].items()])
 @client.tree.command()
 async def weather(interaction, *, city: str):
     """Fetches and displays weather for the specified city."""
-    base_url = "http://api.openweathermap.org/data/2.5/weather"
-    aqi_url = "http://api.openweathermap.org/data/2.5/air_pollution"
-    uvi_url = "http://api.openweathermap.org/data/2.5/uvi"
-    geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
-
-    # Check if city is in custom cities
-    if city.lower() in custom_cities:
-        lat = custom_cities[city.lower()]["lat"]
-        lon = custom_cities[city.lower()]["lon"]
-        city_name = city.title()
-        country = "Custom Location"
-    else:
-        geocode_params = {'q': city, 'appid': weather_api_key, 'limit': 1}
-        geocode_data = get_weather_data(geocode_url, geocode_params)
-
-        if not geocode_data:
-            await interaction.response.send_message("City not found. Please check the\
-                spelling or try a different city.")
+    async with deferred(interaction) as response:
+        snapshot = settings.current
+        base_url = f"{api_base}/data/2.5/weather"
+        aqi_url = f"{api_base}/data/2.5/air_pollution"
+        uvi_url = f"{api_base}/data/2.5/uvi"
+
+        # Custom cities and previously seen cities resolve without a network round trip
+        location = await resolve_city(city)
+        if not location:
+            await response.send("City not found. Please check the\
+            spelling or try a different city.")
+            return
+        lat, lon, city_name, country = location
+
+        # Current conditions, UVI and AQI only depend on the coordinates, so fetch them together
+        params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+        coord_params = {'lat': lat, 'lon': lon, 'appid': weather_api_key}
+        data, uvi_data, aqi_data = await asyncio.gather(
+            fetch_with_timeout(base_url, params, source_timeouts.get("weather", 8)),
+            fetch_with_timeout(uvi_url, coord_params, source_timeouts.get("uvi", 2), optional=True),
+            fetch_with_timeout(aqi_url, coord_params, source_timeouts.get("air_pollution", 2),
+                               optional=True)
+        )
+        if not data or data.get('cod') != 200:
+            await response.send\
+                (f"Error: {(data or {}).get('message', 'Could not retrieve weather data.')}")
             return
 
-        lat = geocode_data[0]['lat']
-        lon = geocode_data[0]['lon']
-        city_name = geocode_data[0]['name']
-        country = geocode_data[0].get('country', 'Unknown')
-
-    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
-    data = get_weather_data(base_url, params)
-    if not data or data.get('cod') != 200:
-        await interaction.response.send_message\
-            (f"Error: {data.get('message', 'Could not retrieve weather data.')}")
-        return
-
-    # Process data
-    temperature = data['main']['temp']
-    weather_description = data['weather'][0]['description']
-    humidity = data['main']['humidity']
-    wind_speed = data['wind']['speed']
-    visibility = data.get('visibility', 0) / 1000
-    feels_like = data['main']['feels_like']
-    pressure = data['main']['pressure']
-    sunrise = datetime.datetime.fromtimestamp(data['sys']['sunrise']).strftime("%H:%M")
-    sunset = datetime.datetime.fromtimestamp(data['sys']['sunset']).strftime("%H:%M")
-    weather_emoji = weather_emojis.get(weather_description.lower(), "🌍")
-    cloud_cover = data.get('clouds', {}).get('all', 0)
-    rain_amount = data.get('rain', {}).get('1h', 0)
-    last_updated = datetime.datetime.fromtimestamp(data['dt']).strftime("%Y-%m-%d %H:%M:%S")
-
-    uvi_data = get_weather_data(uvi_url, {'lat': lat, 'lon': lon, 'appid': weather_api_key})
-    uv_index = uvi_data.get('value', "N/A") if uvi_data else "N/A"
-
-    aqi_data = get_weather_data(aqi_url, {'lat': lat, 'lon': lon, 'appid': weather_api_key})
-    aqi = aqi_data.get('list', [{}])[0].get('main', {}).get('aqi', "N/A") if aqi_data else "N/A"
-
-    aqi_levels = config["aqi_levels"]
-    aqi_colors = config["aqi_colors"]
-    aqi_level = aqi_levels[int(aqi) - 1] if isinstance(aqi, int) and 1 <= aqi <= 5 else "N/A"
-    aqi_color = aqi_colors[int(aqi) - 1] if isinstance(aqi, int) and 1 <= aqi <= 5 else 0x1abc9c
-
-    icon_code = data['weather'][0]['icon']  # e.g., '01d' for a sunny day
-    icon_url = f"http://openweathermap.org/img/wn/{icon_code}@2x.png"
-    # Warnings
-    warnings = []
-    if temperature < config["temperature_levels"]["cold"]["max"]:
-        warnings.append(config["warnings"]["tempcold"])
-    elif temperature > config["temperature_levels"]["hot"]["min"]:
-        warnings.append(config["warnings"]["temphot"])
-
-    if humidity > config["humidity_levels"]["humid"]["max"]:
-        warnings.append(config["warnings"]["humidity"])
-
-    if wind_speed > config["wind_levels"]["strong_wind"]["min"]:
-        warnings.append(config["warnings"]["wind_speed"])
-
-    if uv_index != "N/A" and uv_index > config["uv_levels"]["high"]["min"]:
-        warnings.append(config["warnings"]["uv_index"])
-
-    if isinstance(aqi, int) and 1 <= aqi <= 5:
-        aqi_level_key = config["aqi_levels"][aqi - 1].lower().replace(" ", "_")
-        aqi_warning = config.get("aqi_warnings", {}).get(aqi_level_key, None)
-        if aqi_warning:
-            warnings.append(aqi_warning)
-
-    # Embed for weather data
-    embed = discord.Embed(
-        title=f"Weather in {city_name}, {country}",
-        description=f"{weather_emoji} **{weather_description.capitalize()}**",
-        color=aqi_color
-    )
-    embed.set_thumbnail(url=icon_url)
-    embed.add_field(name="🌡️ Temperature", value=f"{temperature}°C (Feels like\
-{feels_like}°C)\nLevel: {get_level(temperature, config['temperature_levels'])}", inline=True)
-    embed.add_field(name="💧 Humidity", value=f"{humidity}% \
-({get_humidity_level(humidity)})", inline=True)
-    embed.add_field(name="🌬️ Wind Speed", value=f"{wind_speed} m/s \
-({get_wind_level(wind_speed)})", inline=True)
-    embed.add_field(name="🌞 UV Index", value=f"{uv_index} \
-({get_uv_level(uv_index)})", inline=True)
-    embed.add_field(name="🌧️ Rain Amount", value=f"{rain_amount} mm \
-({get_rain_level(rain_amount)})", inline=True)
-    embed.add_field(name="🌫️ Visibility", value=f"{visibility:.1f} km", inline=True)
-    embed.add_field(name="📉 Pressure", value=f"{pressure} hPa", inline=True)
-    embed.add_field(name="☁️ Cloud Cover", value=f"{cloud_cover}%", inline=True)
-    embed.add_field(name="🏭 AQI", value=f"{aqi} ({aqi_level})", inline=True)
-    embed.add_field(name="🌄 Sunrise", value=sunrise, inline=True)
-    embed.add_field(name="🌇 Sunset", value=sunset, inline=True)
-
-    if warnings:
-        embed.add_field(name="⚠️ Warnings", value="\n".join([f"• {warning}" \
-            for warning in warnings]), inline=False)
-
-    embed.set_footer(text=f"Last updated: {last_updated}, provided by OpenWeather")
-    await interaction.response.send_message(embed=embed)
+        # Process data
+        temperature = data['main']['temp']
+        weather_description = data['weather'][0]['description']
+        humidity = data['main']['humidity']
+        wind_speed = data['wind']['speed']
+        visibility = data.get('visibility', 0) / 1000
+        feels_like = data['main']['feels_like']
+        pressure = data['main']['pressure']
+        sunrise = datetime.datetime.fromtimestamp(data['sys']['sunrise']).strftime("%H:%M")
+        sunset = datetime.datetime.fromtimestamp(data['sys']['sunset']).strftime("%H:%M")
+        weather_emoji = snapshot.weather_emojis.get(weather_description.lower(), "🌍")
+        cloud_cover = data.get('clouds', {}).get('all', 0)
+        rain_amount = data.get('rain', {}).get('1h', 0)
+        last_updated = datetime.datetime.fromtimestamp(data['dt']).strftime("%Y-%m-%d %H:%M:%S")
+
+        uv_index = uvi_data.get('value', "N/A") if uvi_data else "N/A"
+        uv_level = snapshot.level_tables["uv"].classify(uv_index) if uv_index != "N/A" else "N/A"
+        aqi = aqi_data.get('list', [{}])[0].get('main', {}).get('aqi', "N/A") if aqi_data else "N/A"
+
+        aqi_levels = snapshot.aqi_levels
+        aqi_colors = snapshot.aqi_colors
+        aqi_level = aqi_levels[int(aqi) - 1] if isinstance(aqi, int) and 1 <= aqi <= 5 else "N/A"
+        aqi_color = aqi_colors[int(aqi) - 1] if isinstance(aqi, int) and 1 <= aqi <= 5 else 0x1abc9c
+
+        icon_code = data['weather'][0]['icon']  # e.g., '01d' for a sunny day
+        icon_url = f"http://openweathermap.org/img/wn/{icon_code}@2x.png"
+        # Warnings, from the same precompiled thresholds the alert poller uses
+        raised = snapshot.alert_evaluator.evaluate(
+            np.array([temperature]), np.array([humidity]), np.array([wind_speed]),
+            np.array([uv_index if uv_index != "N/A" else math.nan], dtype=float),
+            np.array([math.nan])
+        )[0]
+        warnings = [snapshot.warning_messages[name] for name in alert_names(int(raised))]
+
+        if isinstance(aqi, int) and 1 <= aqi <= 5 and snapshot.aqi_warning_messages[aqi - 1]:
+            warnings.append(snapshot.aqi_warning_messages[aqi - 1])
+
+        # Embed for weather data
+        embed = discord.Embed(
+            title=f"Weather in {city_name}, {country}",
+            description=f"{weather_emoji} **{weather_description.capitalize()}**",
+            color=aqi_color
+        )
+        embed.set_thumbnail(url=icon_url)
+        embed.add_field(name="🌡️ Temperature", value=f"{temperature}°C (Feels like\
+{feels_like}°C)\nLevel: {snapshot.level_tables['temperature'].classify(temperature)}", inline=True)
+        embed.add_field(name="💧 Humidity", value=f"{humidity}% \
+({snapshot.level_tables['humidity'].classify(humidity)})", inline=True)
+        embed.add_field(name="🌬️ Wind Speed", value=f"{wind_speed} m/s \
+({snapshot.level_tables['wind'].classify(wind_speed)})", inline=True)
+        embed.add_field(name="🌞 UV Index", value=f"{uv_index} \
+({uv_level})", inline=True)
+        embed.add_field(name="🌧️ Rain Amount", value=f"{rain_amount} mm \
+({snapshot.level_tables['rain'].classify(rain_amount)})", inline=True)
+        embed.add_field(name="🌫️ Visibility", value=f"{visibility:.1f} km", inline=True)
+        embed.add_field(name="📉 Pressure", value=f"{pressure} hPa", inline=True)
+        embed.add_field(name="☁️ Cloud Cover", value=f"{cloud_cover}%", inline=True)
+        embed.add_field(name="🏭 AQI", value=f"{aqi} ({aqi_level})", inline=True)
+        embed.add_field(name="🌄 Sunrise", value=sunrise, inline=True)
+        embed.add_field(name="🌇 Sunset", value=sunset, inline=True)
+
+        if warnings:
+            embed.add_field(name="⚠️ Warnings", value="\n".join([f"• {warning}" \
+                for warning in warnings]), inline=False)
+
+        embed.set_footer(text=f"Last updated: {last_updated}, provided by OpenWeather")
+        await response.send(embed=embed)
+
+class ForecastView(View):
+    """Forecast choice buttons that report errors the same way slash commands do."""
+
+    async def interaction_check(self, interaction):
+        metrics.current_command.set("forecast_button")
+        return True
+
+    async def on_error(self, interaction, error, item):
+        await report_interaction_error(interaction, error)
 
 @client.tree.command()
 async def main_forecast(interaction, *, city: str):
     """Provides buttons for hourly or 6-day forecast."""
-    if city.lower() in custom_cities:
-        lat = custom_cities[city.lower()]["lat"]
-        lon = custom_cities[city.lower()]["lon"]
-        city_name = city.title()
-    else:
-        # Geocode the city if it's not in custom cities
-        geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
-        geocode_params = {'q': city, 'appid': weather_api_key, 'limit': 1}
-        geocode_data = get_weather_data(geocode_url, geocode_params)
-
-        if not geocode_data:
-            await interaction.response.send_message("City not found. \
-                Please check the spelling or try a different city.")
+    async with deferred(interaction) as response:
+        location = await resolve_city(city)
+        if not location:
+            await response.send("City not found. \
+            Please check the spelling or try a different city.")
             return
+        lat, lon, city_name, _ = location
 
-        lat = geocode_data[0]['lat']
-        lon = geocode_data[0]['lon']
-        city_name = geocode_data[0]['name']
+        # Create buttons for hourly or daily forecasts
+        button_hourly = Button(label="3-Hours", style=discord.ButtonStyle.primary)
+        button_daily = Button(label="6-Days", style=discord.ButtonStyle.secondary)
 
-    # Create buttons for hourly or daily forecasts
-    button_hourly = Button(label="3-Hours", style=discord.ButtonStyle.primary)
-    button_daily = Button(label="6-Days", style=discord.ButtonStyle.secondary)
+        view = ForecastView()
+        view.add_item(button_hourly)
+        view.add_item(button_daily)
 
-    view = View()
-    view.add_item(button_hourly)
-    view.add_item(button_daily)
+        async def hourly_callback(interaction):
+            await send_hourly_forecast(interaction, city_name, lat, lon)
 
-    async def hourly_callback(interaction):
-        await send_hourly_forecast(interaction, city_name, lat, lon)
+        async def daily_callback(interaction):
+            await send_daily_forecast(interaction, city_name, lat, lon)
 
-    async def daily_callback(interaction):
-        await send_daily_forecast(interaction, city_name, lat, lon)
+        button_hourly.callback = hourly_callback
+        button_daily.callback = daily_callback
 
-    button_hourly.callback = hourly_callback
-    button_daily.callback = daily_callback
+        await response.send(f"Choose the forecast type for {city_name}:", view=view)
 
-    await interaction.response.send_message(f"Choose the forecast type for {city_name}:", view=view)
+# The forecast handlers and the prefetcher render charts through the same helpers, so a
+# pre-rendered chart has the same cache key as the one a request asks for
+FORECAST_SLOTS = 12
+FORECAST_DAYS = 6
 
-async def send_hourly_forecast(interaction, city_name, lat=None, lon=None):
-    """Displays 3-hour weather forecast for the next 36 hours."""
-    base_url = "http://api.openweathermap.org/data/2.5/forecast"
+def hourly_chart(city_name, hourly):
+    """Render the chart of a ForecastTable.hourly() slice, or reuse the cached one."""
+    return render_chart(
+        charts.render_hourly_chart, city_name, hourly["times"], hourly["temps"],
+        hourly["feels_like"], hourly["humidity"], hourly["wind_speed"], hourly["rain"],
+        hourly["pop"]
+    )
 
-    if lat is None or lon is None:
-        geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
-        geocode_params = {'q': city_name, 'appid': weather_api_key, 'limit': 1}
-        geocode_data = get_weather_data(geocode_url, geocode_params)
+def daily_chart(city_name, daily):
+    """Render the chart of a ForecastTable.daily() reduction, or reuse the cached one."""
+    return render_chart(
+        charts.render_daily_chart, city_name, daily["dates"], daily["min_temp"],
+        daily["max_temp"], daily["feels_like"], daily["humidity"], daily["wind_speed"],
+        daily["rain"], daily["pop"]
+    )
 
-        if not geocode_data:
-            await interaction.response.send_message("City not found. \
+async def send_hourly_forecast(interaction, city_name, lat=None, lon=None):
+    """Displays 3-hour weather forecast for the next 36 hours."""
+    async with deferred(interaction) as response:
+        if lat is None or lon is None:
+            location = await resolve_city(city_name)
+            if not location:
+                await response.send("City not found. \
                 Please check the spelling or try a different city.")
+                return
+            lat, lon, city_name, _ = location
+
+        table = await get_forecast_table(lat, lon)
+        if table is None:
+            await response.send("Error fetching forecast data.")
             return
 
-        lat = geocode_data[0]['lat']
-        lon = geocode_data[0]['lon']
-        city_name = geocode_data[0]['name']
+        snapshot = settings.current
+        hourly = table.hourly(FORECAST_SLOTS)
+        # Level labels for every slot in one vectorized pass per table
+        temp_levels = snapshot.level_tables["temperature"].classify_many(hourly["temps"])
+        humidity_levels = snapshot.level_tables["humidity"].classify_many(hourly["humidity"])
+        wind_levels = snapshot.level_tables["wind"].classify_many(hourly["wind_speed"])
+        rain_levels = snapshot.level_tables["rain"].classify_many(hourly["rain"])
 
-    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+        embed = discord.Embed(
+            title=f"**Hourly Weather Forecast for {city_name}:**",
+            description="Here is the detailed weather forecast for the next 36 hours.",
+            color=0x1abc9c
+        )
 
-    data = get_weather_data(base_url, params)
-    if not data:
-        await interaction.response.send_message("Error fetching forecast data.")
-        return
+        for dt, temp, feels_like, humidity, wind_speed, cloud_cover, pop, rain_amount, description, \
+                temp_level, humidity_level, wind_level, rain_level \
+                in zip(hourly["times"], hourly["temps"], hourly["feels_like"], hourly["humidity"],
+                       hourly["wind_speed"], hourly["clouds"], hourly["pop"], hourly["rain"],
+                       hourly["descriptions"], temp_levels, humidity_levels, wind_levels,
+                       rain_levels):
+            weather_emoji = snapshot.weather_emojis.get(description.lower(), "🌍")
+            embed.add_field(
+                name=f"{dt} - {weather_emoji} {description.title()}",
+                value=(
+                    f"🌡️ **Temp**: {temp:.2f}°C (Feels like **{feels_like:.2f}°C**, {temp_level})\n"
+                    f"💧 **Humidity**: {humidity:g}% ({humidity_level})\n"
+                    f"🌬️ **Wind Speed**: {wind_speed:.2f} m/s ({wind_level})\n"
+                    f"☁️ **Cloud Cover**: {cloud_cover:g}%\n"
+                    f"🌧️ **Precipitation**: {pop}%\n"
+                    f"🌧️ **Rain Amount**: {rain_amount:g} mm ({rain_level})\n"
+                    f"---"
+                ),
+                inline=False
+            )
+
+        # Render the graph for the forecast in a worker process
+        await send_with_image(response, embed, hourly_chart(city_name, hourly),
+                              city_name, "hourly_forecast")
 
-    forecast_list = data.get('list', [])[:12]
 
-    times = []
-    temps = []
-    feels_like_temps = []
-    humidities = []
-    wind_speeds = []
-    rain_amounts = []
-    pops = []
+async def send_daily_forecast(interaction, city_name, lat=None, lon=None):
+    """Displays a 6-day weather forecast with enhanced visualization for better readability."""
+    async with deferred(interaction) as response:
+        if lat is None or lon is None:
+            location = await resolve_city(city_name)
+            if not location:
+                await response.send("City not found. \
+                Please check the spelling or try a different city.")
+                return
+            lat, lon, city_name, _ = location
 
-    embed = discord.Embed(
-        title=f"**Hourly Weather Forecast for {city_name}:**",
-        description="Here is the detailed weather forecast for the next 36 hours.",
-        color=0x1abc9c
-    )
+        table = await get_forecast_table(lat, lon)
+        if table is None:
+            await response.send("Error fetching forecast data.")
+            return
 
-    for forecast in forecast_list:
-        dt = datetime.datetime.fromtimestamp(forecast['dt']).strftime("%b %d, %H:%M")
-        temp = forecast['main']['temp']
-        feels_like = forecast['main']['feels_like']
-        humidity = forecast['main']['humidity']
-        wind_speed = forecast['wind']['speed']
-        cloud_cover = forecast.get('clouds', {}).get('all', 0)
-        pop = int(forecast.get('pop', 0) * 100)
-        rain_amount = forecast.get('rain', {}).get('3h', 0)
-        description = forecast['weather'][0]['description']
-        weather_emoji = weather_emojis.get(description.lower(), "🌍")
-
-        # Store data for plotting
-        times.append(dt)
-        temps.append(temp)
-        feels_like_temps.append(feels_like)
-        humidities.append(humidity)
-        wind_speeds.append(wind_speed)
-        rain_amounts.append(rain_amount)
-        pops.append(pop)
-
-        embed.add_field(
-            name=f"{dt} - {weather_emoji} {description.title()}",
-            value=(
-                f"🌡️ **Temp**: {temp:.2f}°C (Feels like **{feels_like:.2f}°C**)\n"
-                f"💧 **Humidity**: {humidity}%\n"
-                f"🌬️ **Wind Speed**: {wind_speed:.2f} m/s\n"
-                f"☁️ **Cloud Cover**: {cloud_cover}%\n"
-                f"🌧️ **Precipitation**: {pop}%\n"
-                f"🌧️ **Rain Amount**: {rain_amount} mm\n"
-                f"---"
-            ),
-            inline=False
-        )
+        # Per-day reductions for the next 6 days, computed once and shared with the chart
+        daily = table.daily(FORECAST_DAYS)
+        level_tables = settings.current.level_tables
+        max_temp_levels = level_tables["temperature"].classify_many(daily["max_temp"])
+        min_temp_levels = level_tables["temperature"].classify_many(daily["min_temp"])
+        humidity_levels = level_tables["humidity"].classify_many(daily["humidity"])
+        wind_levels = level_tables["wind"].classify_many(daily["wind_speed"])
+        rain_levels = level_tables["rain"].classify_many(daily["rain"])
 
-    # Generate the graph for the forecast
-    fig, ax1 = plt.subplots(figsize=(14, 7))
+        embed = discord.Embed(
+            title=f"**6-Day Weather Forecast for {city_name}:**",
+            description="Here is the detailed weather forecast for the next 6 days.",
+            color=0x1abc9c
+        )
 
-    # Plot temperature and feels-like temperature
-    ax1.plot(times, temps, marker='o', color='red', label='Temperature (°C)')
-    ax1.plot(times, feels_like_temps, marker='x', color='orange', linestyle='--', \
-        label='Feels Like (°C)')
-    ax1.set_ylabel('Temperature (°C)', color='red')
-    ax1.tick_params(axis='y', labelcolor='red')
+        for day, min_temp, max_temp, avg_feel, avg_hum, avg_wind, total_rain, avg_pop, \
+                min_level, max_level, humidity_level, wind_level, rain_level in zip(
+                daily["dates"], daily["min_temp"], daily["max_temp"], daily["feels_like"],
+                daily["humidity"], daily["wind_speed"], daily["rain"], daily["pop"],
+                min_temp_levels, max_temp_levels, humidity_levels, wind_levels, rain_levels):
+
+            embed.add_field(
+                name=f"{day}",
+                value=(
+                    f"🌡️ Max Temp: {max_temp:g}°C ({max_level})\n"
+                    f"🌡️ Min Temp: {min_temp:g}°C ({min_level})\n"
+                    f"🔥 Feels Like Avg: {avg_feel:.2f}°C\n"
+                    f"💧 Humidity Avg: {avg_hum:.2f}% ({humidity_level})\n"
+                    f"🌬️ Wind Speed Avg: {avg_wind:.2f} m/s ({wind_level})\n"
+                    f"🌧️ Rain Probability Avg: {avg_pop:.2f}%\n"
+                    f"🌧️ Total Rain Amount: {total_rain:.2f} mm ({rain_level})"
+                ),
+                inline=False
+            )
+
+        # Render the figure in a worker process to keep the event loop free
+        await send_with_image(response, embed, daily_chart(city_name, daily),
+                              city_name, "daily_forecast")
+
+# Multi-city comparison, fetched in parallel so it costs about as much as the slowest city
+compare_config = config.get("compare", {})
+
+async def fetch_current_weather(city, semaphore):
+    """Resolve a city and fetch its current weather; returns (location, data).
+
+    Returns the reason instead when there is nothing to show: "Not found" for a city
+    that can't be resolved and "Unavailable" when the lookup or fetch failed, e.g.
+    because the API budget ran out.
+    """
+    async with semaphore:
+        try:
+            location = await resolve_city(city)
+        except RateLimitExceeded:
+            return "Unavailable"
+        if not location:
+            return "Not found"
+        lat, lon, _, _ = location
+        params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+        data = await fetch_with_timeout(f"{api_base}/data/2.5/weather", params,
+                                        source_timeouts.get("weather", 8), optional=True)
+    if not data or 'main' not in data:
+        return "Unavailable"
+    return location, data
 
-    # Plot rain probability and rain amount as bars
-    ax1.bar(times, pops, alpha=0.2, color='cyan', label='Rain Probability (%)', width=0.5)
-    ax1.bar(times, rain_amounts, alpha=0.4, color='blue', label='Rain Amount (mm)', width=0.3)
+@client.tree.command()
+async def compare(interaction, *, cities: str):
+    """Compares the current weather of several comma separated cities."""
+    async with deferred(interaction) as response:
+        snapshot = settings.current
+        max_cities = compare_config.get("max_cities", 6)
+        names = list(dict.fromkeys(name.strip() for name in cities.split(",") if name.strip()))
+        if len(names) < 2:
+            await response.send("Provide at least two cities separated by \
+commas, e.g. /compare Bangkok, London, Tokyo")
+            return
+        if len(names) > max_cities:
+            await response.send(f"You can compare up to {max_cities} cities \
+at once.")
+            return
 
-    # Create a secondary axis for humidity and wind speed
-    ax2 = ax1.twinx()
-    ax2.plot(times, humidities, marker='^', linestyle='--', color='blue', label='Humidity (%)')
-    ax2.plot(times, wind_speeds, marker='s', linestyle='-', color='green', label='Wind Speed (m/s)')
-    ax2.set_ylabel('Humidity (%) / Wind Speed (m/s)', color='blue')
-    ax2.tick_params(axis='y', labelcolor='blue')
+        semaphore = asyncio.Semaphore(compare_config.get("max_concurrency", 6))
+        results = await asyncio.gather(*[fetch_current_weather(name, semaphore) for name in names])
+        found = [result for result in results if not isinstance(result, str)]
+        missing = {}
+        for name, result in zip(names, results):
+            if isinstance(result, str):
+                missing.setdefault(result, []).append(name)
+        if not found:
+            await response.send("None of those cities could be found." \
+                if list(missing) == ["Not found"] else \
+                "Weather for those cities is unavailable right now. Please try again later.")
+            return
 
-    # Adjust x-axis labels to avoid overlapping
-    plt.xticks(rotation=45, ha="right", fontsize=10)
+        embed = discord.Embed(
+            title="Weather Comparison",
+            description=f"Current conditions in {len(found)} cities.",
+            color=0x1abc9c
+        )
+        for (_, _, city_name, country), data in found:
+            description = data['weather'][0]['description']
+            temperature = data['main']['temp']
+            embed.add_field(
+                name=f"{snapshot.weather_emojis.get(description.lower(), '🌍')} {city_name}, {country}",
+                value=(
+                    f"{description.capitalize()}\n"
+                    f"🌡️ {temperature:g}°C (Feels like {data['main']['feels_like']:g}°C, "
+                    f"{snapshot.level_tables['temperature'].classify(temperature)})\n"
+                    f"💧 {data['main']['humidity']}% \
+({snapshot.level_tables['humidity'].classify(data['main']['humidity'])})\n"
+                    f"🌬️ {data['wind']['speed']} m/s \
+({snapshot.level_tables['wind'].classify(data['wind']['speed'])})"
+                ),
+                inline=True
+            )
+        for reason, missing_names in missing.items():
+            embed.add_field(name=reason, value=", ".join(missing_names), inline=False)
+
+        city_names = [city_name for (_, _, city_name, _), _ in found]
+        await send_with_image(response, embed, render_chart(
+            charts.render_compare_chart, city_names,
+            [data['main']['temp'] for _, data in found],
+            [data['main']['feels_like'] for _, data in found],
+            [data['main']['humidity'] for _, data in found],
+            [data['wind']['speed'] for _, data in found]
+        ), *city_names, "compare")
+
+# Hurricane data loads in the background after startup and is snapshotted to disk
+storm_config = config.get("storms", {})
+storm_archive = StormArchive(
+    basin=storm_config.get("basin", "north_atlantic"),
+    snapshot_dir=storm_config.get("snapshot_dir", "data/north_atlantic"),
+    max_age_days=storm_config.get("snapshot_max_age_days", 30)
+)
+# Maps rendered with other output settings get other file names, so they aren't served
+track_cache = DiskImageCache(
+    storm_config.get("track_cache_dir", "data/tracks"),
+    version="v1-" + charts.chart_digest(charts.render_storm_track, render_output)[:8],
+    extension=image_extension
+)
+
+async def get_track_image(storm_id):
+    """Return the track map for a storm, rendering and storing it on disk on first use."""
+    image_bytes = await asyncio.to_thread(track_cache.get, storm_id)
+    if image_bytes is not None:
+        return image_bytes
+
+    async def render():
+        storm_dict = storm_archive.points.storm_dict(storm_archive.index.row_of(storm_id))
+        title = f"Track of {storm_dict['name'].capitalize()} ({storm_dict['year']})"
+        with metrics.stage("render"):
+            rendered = await render_pool.render(charts.render_storm_track, storm_dict, title)
+        await asyncio.to_thread(track_cache.set, storm_id, rendered)
+        return rendered
+
+    # Concurrent requests for a storm, and the pre-render task, share one slow render
+    return await in_flight.run(("track", storm_id), render)
+
+@tasks.loop(count=1)
+async def prerender_tracks_task():
+    """Pre-render track maps for the most notable storms once the archive is loaded."""
+    if not await storm_archive.wait_ready():
+        return
+    notable_rows = storm_archive.index.notable(storm_config.get("prerender_count", 25))
+    pending = [storm_archive.index.ids[row] for row in notable_rows \
+        if storm_archive.index.ids[row] not in track_cache]
+    rendered = 0
+    for storm_id in pending:
+        try:
+            await get_track_image(storm_id)
+            rendered += 1
+        except RenderQueueFull:
+            # Leave room for interactive requests and try the rest on the next start
+            break
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to pre-render track for %s", storm_id)
+    if pending:
+        logger.info("Pre-rendered %d of %d notable storm tracks.", rendered, len(pending))
+
+async def storms_loaded(response):
+    """Whether the storm archive is ready; if not, start loading it and tell the user."""
+    if storm_archive.ready:
+        return True
+    storm_archive.start()
+    await response.send("Hurricane data is still loading. Please try again in a minute.")
+    return False
+
+def format_measure(value, unit, spec=".0f"):
+    """Format a storm measurement, showing N/A for missing values."""
+    if value is None or math.isnan(value):
+        return "N/A"
+    return f"{value:{spec}} {unit}".strip()
 
-    # Title and legend adjustments for better visibility
-    plt.title(f"Hourly Weather Forecast for the Next 36 Hours in {city_name}", fontsize=16)
-    fig.legend(loc='upper center', bbox_to_anchor=(0.5, 1.12), fontsize=10, ncol=3)
+@client.tree.command()
+async def hurricane(interaction, *, stormname_year: str):
+    """
+    Command to retrieve and display information about a tropical cyclone.
+    Usage: !hurricane [Storm Name] [Year]
+    Example: !hurricane Dorian 2019
+    """
+    async with deferred(interaction) as response:
+        if not await storms_loaded(response):
+            return
 
-    # Add a grid for better readability
-    ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+        try:
+            storm_name, year = stormname_year.split()
+            year = int(year)
+        except ValueError:
+            await response.send("Provide the storm name and year in the format:\
+            /hurricane [Storm Name] [Year]")
+            return
 
-    image_path = f"{city_name}_hourly_forecast.png"
-    plt.tight_layout()
-    plt.savefig(image_path, bbox_inches='tight')
-    plt.close()
+        # Answer from the precomputed summary index without building a Storm object
+        summary = storm_archive.index.lookup(storm_name, year)
 
-    embed.set_image(url="attachment://" + image_path)
+        # Check if storm data was found
+        if not summary:
+            suggestions = storm_archive.index.suggest(storm_name, year)
+            hint = f" Did you mean: {', '.join(name.title() for name in suggestions)}?" \
+                if suggestions else ""
+            await response.send(f"Storm '{storm_name} \
+{year}' not found in the data.{hint}")
+            return
 
-    await interaction.response.send_message(embed=embed, file=discord.File(image_path))
+        max_wind = summary['max_wind']  # Max wind speed in knots
+        min_pressure = summary['min_pressure']  # Min pressure in hPa
+        start_date = summary['start'].strftime("%Y-%m-%d")
+        end_date = summary['end'].strftime("%Y-%m-%d")
+        ace = summary['ace']
 
-    # Clean up the saved image
-    if os.path.exists(image_path):
-        os.remove(image_path)
+        # Create an embed to display storm information
+        embed = discord.Embed(
+            title=f"🌀 Hurricane Info: {storm_name.capitalize()} {year}",
+            description=f"Start Date: {start_date}\nEnd Date: {end_date}",
+            color=0x3498db
+        )
+        embed.add_field(name="Category", value=summary['category'], inline=True)
+        embed.add_field(name="Duration", value=f"{summary['duration_days']} days", inline=True)
+        embed.add_field(name="Accumulated Cyclone Energy (ACE)", \
+            value=format_measure(ace, "", ".4g"), inline=True)
+        embed.add_field(name="Max Wind Speed", value=format_measure(max_wind, "knots"), inline=True)
+        embed.add_field(name="Min Pressure", value=format_measure(min_pressure, "hPa"), inline=True)
+
+        # Track maps never change, so serve them from the on-disk cache when possible;
+        # a fresh Cartopy render takes seconds, so the summary goes out first. A failed
+        # render reaches on_app_command_error and is recorded as an error.
+        await send_with_image(response, embed, get_track_image(summary['id']),
+                              storm_name, year, "track")
+
+# Season and climatology queries run over whole columns of the storm archive at once
+def parse_seasons(text):
+    """Parse '2019' or '2010-2019' into (first_year, last_year)."""
+    first, _, last = text.replace("–", "-").partition("-")
+    first_year = int(first)
+    last_year = int(last) if last.strip() else first_year
+    if last_year < first_year:
+        raise ValueError(f"{text} is not a range of seasons")
+    return first_year, last_year
+
+def storm_line(row, detail):
+    """One line naming a storm by its StormIndex row, followed by detail."""
+    index = storm_archive.index
+    return f"{index.names[row].title()} {index.years[row]}: {detail}"
 
+@client.tree.command()
+async def season(interaction, *, years: str):
+    """
+    Storm counts by category, total ACE and the strongest storms of one or more seasons.
+    Usage: !season [Year] or !season [First Year]-[Last Year]
+    """
+    async with deferred(interaction) as response:
+        if not await storms_loaded(response):
+            return
+        try:
+            first_year, last_year = parse_seasons(years)
+        except ValueError:
+            await response.send("Provide a season or range of seasons, e.g. /season 2019 \
+or /season 2010-2019")
+            return
 
-async def send_daily_forecast(interaction, city_name, lat=None, lon=None):
-    """Displays a 6-day weather forecast with enhanced visualization for better readability."""
-    base_url = "http://api.openweathermap.org/data/2.5/forecast"
+        # Only seasons on record count, so huge ranges can't allocate huge arrays
+        index = storm_archive.index
+        first_year = max(first_year, int(index.years.min()))
+        last_year = min(last_year, int(index.years.max()))
+        if last_year < first_year:
+            await response.send(f"No seasons on record in {years}; records cover \
+{index.years.min()}–{index.years.max()}.")
+            return
+        max_seasons = storm_config.get("max_seasons", 200)
+        if last_year - first_year + 1 > max_seasons:
+            await response.send(f"Choose a range of at most {max_seasons} seasons.")
+            return
 
-    if lat is None or lon is None:
-        geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
-        geocode_params = {'q': city_name, 'appid': weather_api_key, 'limit': 1}
-        geocode_data = get_weather_data(geocode_url, geocode_params)
+        season_years, ace, counts = index.season_stats(first_year, last_year)
+        label = str(first_year) if first_year == last_year else f"{first_year}–{last_year}"
+        embed = discord.Embed(
+            title=f"🌀 Season Summary: {label}",
+            description=f"{counts.sum()} storms, total ACE {ace.sum():.1f}",
+            color=0x3498db
+        )
+        for category, count in zip(CATEGORIES, counts.sum(axis=0)):
+            embed.add_field(name=category, value=str(count), inline=True)
+        if last_year > first_year and ace.any():
+            busiest = int(np.argmax(ace))
+            embed.add_field(name="Most Active Season", inline=True,
+                            value=f"{season_years[busiest]} (ACE {ace[busiest]:.1f})")
+        strongest = index.strongest(first_year, last_year,
+                                    storm_config.get("list_limit", 10))
+        embed.add_field(name="Strongest Storms", inline=False, value="\n".join(
+            storm_line(row, f"{index.max_wind[row]:.0f} knots, {index.categories[row]}")
+            for row in strongest) or "No storms recorded.")
+
+        if last_year == first_year:
+            await response.send(embed=embed)
+            return
+        await send_with_image(response, embed, render_chart(
+            charts.render_season_chart, label, season_years.tolist(), ace.tolist(),
+            counts.tolist(), list(CATEGORIES)
+        ), "season", label)
 
-        if not geocode_data:
-            await interaction.response.send_message("City not found. \
-                Please check the spelling or try a different city.")
+@client.tree.command()
+async def strongest(interaction, *, start_date: str, end_date: str):
+    """
+    The storms with the highest winds between two dates.
+    Usage: !strongest [YYYY-MM-DD] [YYYY-MM-DD]
+    """
+    async with deferred(interaction) as response:
+        if not await storms_loaded(response):
+            return
+        try:
+            start = datetime.date.fromisoformat(start_date.strip())
+            end = datetime.date.fromisoformat(end_date.strip())
+        except ValueError:
+            await response.send("Provide dates in the format YYYY-MM-DD, \
+e.g. /strongest 2005-08-01 2005-09-30")
             return
 
-        lat = geocode_data[0]['lat']
-        lon = geocode_data[0]['lon']
-        city_name = geocode_data[0]['name']
+        # The end date counts in full
+        rows, peaks = storm_archive.points.strongest(
+            start, datetime.datetime.combine(end, datetime.time.max),
+            storm_config.get("list_limit", 10))
+        embed = discord.Embed(
+            title=f"🌀 Strongest Storms: {start} to {end}",
+            description="\n".join(
+                storm_line(row, f"{peak:.0f} knots") for row, peak in zip(rows, peaks)
+            ) or "No storms were active in this period.",
+            color=0x3498db
+        )
+        await response.send(embed=embed)
 
-    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
-    data = get_weather_data(base_url, params)
+@client.tree.command()
+async def nearby(interaction, *, city: str, radius_km: int = 200, years: str = ""):
+    """
+    Storms whose track passed within a distance of a city.
+    Usage: !nearby [city] [radius_km] [years]
+    """
+    async with deferred(interaction) as response:
+        if not await storms_loaded(response):
+            return
+        max_radius = storm_config.get("max_radius_km", 1000)
+        if not 0 < radius_km <= max_radius:
+            await response.send(f"Choose a radius between 1 and {max_radius} km.")
+            return
+        storm_mask = None
+        if years.strip():
+            try:
+                first_year, last_year = parse_seasons(years)
+            except ValueError:
+                await response.send("Provide a season or range of seasons, e.g. 2019 \
+or 2010-2019")
+                return
+            index_years = storm_archive.index.years
+            storm_mask = (index_years >= first_year) & (index_years <= last_year)
+
+        location = await resolve_city(city)
+        if not location:
+            await response.send("City not found. Please check the\
+            spelling or try a different city.")
+            return
+        lat, lon, city_name, _ = location
 
-    if not data:
-        await interaction.response.send_message("Error fetching forecast data.")
+        points = storm_archive.points
+        rows, distances, closest, total = points.near(
+            lat, lon, radius_km, storm_mask, storm_config.get("list_limit", 10))
+        embed = discord.Embed(
+            title=f"🌀 Storms within {radius_km} km of {city_name}",
+            description=f"{total} storms passed within {radius_km} km." if total else \
+                f"No recorded storm passed within {radius_km} km.",
+            color=0x3498db
+        )
+        if total:
+            embed.add_field(name="Closest Approaches", inline=False, value="\n".join(
+                storm_line(row, f"{distance:.0f} km on "
+                                f"{points.timestamp(point):%Y-%m-%d}, "
+                                f"{format_measure(float(points.wind(point)), 'knots')}")
+                for row, distance, point in zip(rows, distances, closest)))
+        await response.send(embed=embed)
+
+# Weather alert subscriptions, polled in batches by unique location
+alert_config = config.get("alerts", {})
+subscription_store = SubscriptionStore(alert_config.get("db_path", "data/subscriptions.sqlite3"))
+# Polls queue behind every interactive request in the rate limiter
+alert_priority = alert_config.get("priority", 3)
+
+async def poll_location(lat, lon, semaphore):
+    """Fetch (temp, humidity, wind, uv, aqi) for one location, using NaN for missing values."""
+    base_url = f"{api_base}/data/2.5/weather"
+    aqi_url = f"{api_base}/data/2.5/air_pollution"
+    uvi_url = f"{api_base}/data/2.5/uvi"
+    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+    coord_params = {'lat': lat, 'lon': lon, 'appid': weather_api_key}
+    async with semaphore:
+        # Interactive requests come first; a skipped location keeps its alert state
+        if rate_limiter.would_wait():
+            return None
+        data, uvi_data, aqi_data = await asyncio.gather(
+            fetch_with_timeout(base_url, params, source_timeouts.get("weather", 8),
+                               optional=True, priority=alert_priority),
+            fetch_with_timeout(uvi_url, coord_params, source_timeouts.get("uvi", 2),
+                               optional=True, priority=alert_priority),
+            fetch_with_timeout(aqi_url, coord_params, source_timeouts.get("air_pollution", 2),
+                               optional=True, priority=alert_priority)
+        )
+    if not data or 'main' not in data:
+        return None
+    uv_index = uvi_data.get('value', math.nan) if uvi_data else math.nan
+    aqi = aqi_data.get('list', [{}])[0].get('main', {}).get('aqi', math.nan) \
+        if aqi_data else math.nan
+    return (data['main']['temp'], data['main']['humidity'], data['wind']['speed'], uv_index, aqi)
+
+def alert_messages(snapshot, raised, aqi):
+    """Build the warning lines for a set of newly raised alerts."""
+    messages = []
+    for name in alert_names(raised):
+        if name == "aqi":
+            messages.append(snapshot.aqi_warning_messages[int(aqi) - 1] or "Poor air quality.")
+        else:
+            messages.append(snapshot.warning_messages[name])
+    return messages
+
+@tasks.loop(minutes=alert_config.get("poll_minutes", 15))
+async def alerts_task():
+    """Poll each subscribed location once and post alerts on state transitions."""
+    snapshot = settings.current
+    subscriptions = await asyncio.to_thread(subscription_store.load_arrays)
+    # Each shard process only handles the channels of the guilds it serves
+    subscriptions = select_subscriptions(subscriptions, np.array(
+        [client.get_channel(int(channel_id)) is not None \
+            for channel_id in subscriptions["channel_id"]], dtype=bool))
+    if not len(subscriptions["id"]):
         return
 
-    # Extract daily data
-    daily_data = {}
-    for forecast in data.get('list', []):
-        date = datetime.datetime.fromtimestamp(forecast['dt']).strftime("%B %d, %Y")
-        temp = forecast['main']['temp']
-        feels_like = forecast['main']['feels_like']
-        humidity = forecast['main']['humidity']
-        wind_speed = forecast['wind']['speed']
-        rain_amount = forecast.get('rain', {}).get('3h', 0)
-        pop = forecast.get('pop', 0) * 100
-
-        if date not in daily_data:
-            daily_data[date] = {'temps': [], 'feels_like': [], \
-                'humidities': [], 'wind_speeds': [], 'rain': [], 'pop': []}
-
-        daily_data[date]['temps'].append(temp)
-        daily_data[date]['feels_like'].append(feels_like)
-        daily_data[date]['humidities'].append(humidity)
-        daily_data[date]['wind_speeds'].append(wind_speed)
-        daily_data[date]['rain'].append(rain_amount)
-        daily_data[date]['pop'].append(pop)
-
-    # Prepare data for the next 6 days
-    dates = list(daily_data.keys())[:6]
-    min_temps = [min(daily_data[day]['temps']) for day in dates]
-    max_temps = [max(daily_data[day]['temps']) for day in dates]
-    avg_feels_like = [sum(daily_data[day]['feels_like']) / \
-        len(daily_data[day]['feels_like']) for day in dates]
-    avg_humidity = [sum(daily_data[day]['humidities']) / \
-        len(daily_data[day]['humidities']) for day in dates]
-    avg_wind_speed = [sum(daily_data[day]['wind_speeds']) / \
-        len(daily_data[day]['wind_speeds']) for day in dates]
-    total_rain = [sum(daily_data[day]['rain']) for day in dates]
-    avg_pop = [sum(daily_data[day]['pop']) / \
-        len(daily_data[day]['pop']) for day in dates]
-
-    # Create the figure with subplots to separate temperature and rain data
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True)
-
-    # Subplot 1: Temperature (Min, Max, Feels-Like)
-    ax1.bar(dates, max_temps, color='#FF4500', alpha=0.7, label='Max Temperature (°C)', width=0.4)
-    ax1.bar(dates, min_temps, color='#FFA500', alpha=0.7, label='Min Temperature (°C)', width=0.4)
-    ax1.plot(dates, avg_feels_like, marker='o', linestyle='--', \
-        color='darkred', label='Feels Like Avg (°C)', linewidth=2)
-    ax1.set_ylabel('Temperature (°C)', color='red')
-    ax1.tick_params(axis='y', labelcolor='red')
-    ax1.legend(loc='upper left', fontsize=9)
-
-    # Subplot 2: Rain Probability, Rain Amount, Humidity, Wind Speed
-    x_indices = range(len(dates))
-    ax2.bar([x - 0.2 for x in x_indices], avg_pop, alpha=0.2, \
-        color='cyan', label='Rain Probability (%)', width=0.4, hatch='//')
-    ax2.bar([x + 0.2 for x in x_indices], total_rain, alpha=0.4, \
-        color='navy', label='Total Rain Amount (mm)', width=0.4)
-    ax2.plot(dates, avg_humidity, marker='^', linestyle='--', \
-        color='blue', label='Humidity (%)', linewidth=1.5)
-    ax2.plot(dates, avg_wind_speed, marker='s', linestyle='-', \
-        color='green', label='Wind Speed (m/s)', linewidth=2)
-    ax2.set_ylabel('Rainfall (mm)\nHumidity (%) / Wind Speed (m/s)', color='blue')
-    ax2.tick_params(axis='y', labelcolor='blue')
-    ax2.legend(loc='upper left', fontsize=9)
-
-    # Set the x-axis label for the entire figure
-    plt.xticks(rotation=45, ha="right", fontsize=10)
-    plt.xlabel('Date', fontsize=12)
-
-    # Title for the entire figure
-    plt.suptitle(f"6-Day Weather Forecast - {city_name}", fontsize=16)
-
-    # Adjust layout for better readability
-    plt.tight_layout(rect=[0, 0, 1, 0.95])
-
-    # Add a grid for better readability
-    ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
-    ax2.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
-
-    image_path = f"{city_name}_daily_forecast.png"
-    plt.savefig(image_path, bbox_inches='tight')
-    plt.close()
+    # One upstream poll per unique rounded location, however many channels follow it
+    coordinates = np.round(np.column_stack((subscriptions["lat"], subscriptions["lon"])),
+                           coord_precision)
+    locations, location_index = np.unique(coordinates, axis=0, return_inverse=True)
+    location_index = location_index.ravel()
+    semaphore = asyncio.Semaphore(alert_config.get("max_concurrency", 10))
+    readings = await asyncio.gather(
+        *[poll_location(float(lat), float(lon), semaphore) for lat, lon in locations]
+    )
 
-    embed = discord.Embed(
-        title=f"**6-Day Weather Forecast for {city_name}:**",
-        description="Here is the detailed weather forecast for the next 6 days.",
-        color=0x1abc9c
+    valid = np.array([reading is not None for reading in readings])
+    values = np.array([reading if reading is not None else (math.nan,) * 5 \
+        for reading in readings], dtype=float)
+    location_masks = snapshot.alert_evaluator.evaluate(*values.T)
+    raised, new_state = snapshot.alert_evaluator.transitions(
+        location_masks, location_index, valid, subscriptions["alert_mask"], subscriptions["state"]
     )
 
-    embed.set_image(url="attachment://" + image_path)
-
-    for day in dates:
-        min_temp = min(daily_data[day]['temps'])
-        max_temp = max(daily_data[day]['temps'])
-        avg_feel = sum(daily_data[day]['feels_like']) / len(daily_data[day]['feels_like'])
-        avg_hum = sum(daily_data[day]['humidities']) / len(daily_data[day]['humidities'])
-        avg_wind = sum(daily_data[day]['wind_speeds']) / len(daily_data[day]['wind_speeds'])
-        total_rain = sum(daily_data[day]['rain'])
-        avg_pop = sum(daily_data[day]['pop']) / len(daily_data[day]['pop'])
-
-        embed.add_field(
-            name=f"{day}",
-            value=(
-                f"🌡️ Max Temp: {max_temp}°C\n"
-                f"🌡️ Min Temp: {min_temp}°C\n"
-                f"🔥 Feels Like Avg: {avg_feel:.2f}°C\n"
-                f"💧 Humidity Avg: {avg_hum:.2f}%\n"
-                f"🌬️ Wind Speed Avg: {avg_wind:.2f} m/s\n"
-                f"🌧️ Rain Probability Avg: {avg_pop:.2f}%\n"
-                f"🌧️ Total Rain Amount: {total_rain} mm"
-            ),
-            inline=False
+    for row in np.flatnonzero(raised):
+        channel = client.get_channel(int(subscriptions["channel_id"][row]))
+        if channel is None:
+            continue
+        embed = discord.Embed(
+            title=f"⚠️ Weather alert for {subscriptions['city'][row]}",
+            description="\n".join(f"• {message}" for message in alert_messages(
+                snapshot, int(raised[row]), values[location_index[row], 4])),
+            color=0xe67e22
         )
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as err:
+            logger.warning("Could not post alert to channel %s: %s", channel.id, err)
+
+    changed = np.flatnonzero(new_state != subscriptions["state"])
+    if len(changed):
+        await asyncio.to_thread(subscription_store.update_states,
+                                subscriptions["id"][changed], new_state[changed])
+    logger.info("Alert poll: %d subscriptions, %d locations, %d alerts posted.",
+                len(subscriptions["id"]), len(locations), np.count_nonzero(raised))
+
+@alerts_task.error
+async def alerts_task_error(error):
+    """Keep the alert scheduler alive after an unexpected failure."""
+    logger.exception("Alert poll failed:", exc_info=error)
 
-    await interaction.response.send_message(embed=embed, file=discord.File(image_path))
-
-    if os.path.exists(image_path):
-        os.remove(image_path)
+@client.tree.command()
+async def subscribe(interaction, *, city: str, alerts: str = "all"):
+    """Subscribe this channel to weather alerts for a city."""
+    async with deferred(interaction) as response:
+        try:
+            mask = parse_alert_mask(alerts)
+        except ValueError as err:
+            await response.send(
+                f"{err}. Choose from: all, {', '.join(ALERT_TYPES)}"
+            )
+            return
+        location = await resolve_city(city)
+        if not location:
+            await response.send("City not found. Please check the\
+            spelling or try a different city.")
+            return
+        lat, lon, city_name, _ = location
+        await asyncio.to_thread(subscription_store.add, interaction.channel_id,
+                                interaction.user.id, city_name, lat, lon, mask)
+        await response.send(
+            f"This channel will now get {', '.join(alert_names(mask))} alerts for {city_name}."
+        )
 
-basin = tracks.TrackDataset(basin='north_atlantic')
+@client.tree.command()
+async def unsubscribe(interaction, *, city: str):
+    """Stop weather alerts for a city in this channel."""
+    async with deferred(interaction) as response:
+        # Subscriptions are stored under the resolved name, which is usually what was typed
+        city_name = " ".join(city.split())
+        removed = await asyncio.to_thread(subscription_store.remove, interaction.channel_id,
+                                          city_name)
+        if not removed:
+            location = await lookup_city(city)
+            if location and location[2].lower() != city_name.lower():
+                city_name = location[2]
+                removed = await asyncio.to_thread(subscription_store.remove,
+                                                  interaction.channel_id, city_name)
+        if removed:
+            await response.send(f"Unsubscribed from alerts for {city_name}.")
+        else:
+            await response.send(f"This channel isn't subscribed to {city_name}.")
 
 @client.tree.command()
-async def hurricane(interaction, *, stormname_year: str):
-    """
-    Command to retrieve and display information about a tropical cyclone.
-    Usage: !hurricane [Storm Name] [Year]
-    Example: !hurricane Dorian 2019
+async def subscriptions(interaction):
+    """Lists the weather alert subscriptions of this channel."""
+    rows = await asyncio.to_thread(subscription_store.for_channel, interaction.channel_id)
+    embed = discord.Embed(
+        title="Weather Alert Subscriptions",
+        description="\n".join(f"{city}: {', '.join(alert_names(mask))}" for city, mask in rows) \
+            or "No subscriptions in this channel.",
+        color=0x1abc9c
+    )
+    await interaction.response.send_message(embed=embed)
+
+def record_command(interaction, status):
+    """Record the end-to-end latency of an interaction since Discord created it."""
+    name = interaction.command.name if interaction.command is not None else "component"
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.command_seconds.observe(elapsed, command=name, status=status)
+
+@client.event
+async def on_app_command_completion(interaction, command):
+    """Record latency of successful slash commands."""
+    record_command(interaction, "ok")
+
+def observe_upstream(url, status, seconds):
+    """WeatherClient hook recording upstream status codes and latency."""
+    endpoint = url.rsplit('/', 1)[-1]
+    metrics.upstream_responses.inc(endpoint=endpoint, status=status)
+    metrics.upstream_seconds.observe(seconds, endpoint=endpoint)
+
+weather_client.on_response = observe_upstream
+
+def cache_gauges():
+    """Hit rate of each cache, for the metrics endpoint."""
+    return {
+        "weather": weather_cache.stats()["hit_rate"],
+        "chart": chart_cache.stats()["hit_rate"],
+        "forecast_table": forecast_tables.stats()["hit_rate"],
+        "shared": shared_cache.hit_rate if shared_cache is not None else 0.0
+    }
+
+metrics.registry.gauge("skywatcher_cache_hit_ratio", "Cache hit ratio.", ("cache",),
+                       callback=cache_gauges)
+metrics.registry.gauge("skywatcher_render_queue_depth", "Charts waiting for or in a worker.",
+                       callback=lambda: render_pool.pending)
+metrics.registry.gauge("skywatcher_inflight_requests", "Distinct upstream calls in flight.",
+                       callback=lambda: len(in_flight))
+metrics.registry.gauge("skywatcher_api_quota_remaining", "Remaining OpenWeather budget.",
+                       ("window",), callback=lambda: {
+                           "minute": rate_limiter.headroom()["minute_tokens"],
+                           "day": rate_limiter.headroom()["daily_remaining"]})
+
+@tasks.loop(minutes=metrics_config.get("dump_minutes", 5))
+async def metrics_dump_task():
+    """Periodically write the metrics snapshot to a file for offline inspection."""
+    with open(metrics_config["dump_path"], 'w', encoding='utf-8') as dump_file:
+        dump_file.write(metrics.registry.render())
+
+@tasks.loop(minutes=shared_config.get("purge_minutes", 30))
+async def shared_cache_purge_task():
+    """Drop shared cache entries that are too old even for the stale fallback."""
+    purged = await asyncio.to_thread(shared_cache.purge, shared_config.get("stale_grace", 86400))
+    if purged:
+        logger.info("Purged %d expired shared cache entries.", purged)
+
+# Prefetcher: keeps the hottest locations' data and charts fresh ahead of requests
+prefetch_priority = prefetch_config.get("priority", 3)
+
+async def refresh_weather(url, params, lead):
+    """Fetch a payload again if its cached copy is missing or expires within lead seconds.
+
+    Runs behind every interactive request in the rate limiter queue and skips the fetch
+    when a token isn't free right away. Returns whether it fetched.
     """
-    try:
-        storm_name, year = stormname_year.split()
-        year = int(year)
-        
-        # Retrieve specific storm by name and year
-        storm = basin.get_storm((storm_name, year))
+    key = weather_cache_key(url, params)
+    if key is None or weather_cache.expires_in(key) > lead or rate_limiter.would_wait():
+        return False
+    endpoint = key[0]
 
-        # Check if storm data was found
-        if not storm:
-            await interaction.response.send_message(f"Storm '{storm_name}\
-                {year}' not found in the data.")
-            return
+    async def fetch_upstream():
+        return await weather_client.get_json(url, params, prefetch_priority)
 
-        # Get basic storm information from the dictionary structure
-        max_wind = max(storm.dict['vmax'])  # Max wind speed in knots
-        min_pressure = min(storm.dict['mslp'])  # Min pressure in hPa
-        start_date = storm.dict['time'][0].strftime("%Y-%m-%d")
-        end_date = storm.dict['time'][-1].strftime("%Y-%m-%d")
-        # Calculate storm duration
-        duration_days = (storm.dict['time'][-1] - storm.dict['time'][0]).days
-
-        # Calculate ACE
-        ace = storm.dict.get('ace', "N/A")
-
-        # Determine storm category based on max wind speed
-        category = "Tropical Depression" if max_wind < 39 else \
-                "Tropical Storm" if max_wind < 74 else \
-                "Hurricane" if max_wind < 113 else \
-                "Major Hurricane"
-
-        # Format the storm track information
-        track_message = "\n".join([
-            f"Time: {time.strftime('%Y-%m-%d %H:%M')}, Lat: {lat}, Lon: {lon}, Wind: {vmax} knots"
-            for time, lat, lon, vmax in zip(storm.dict['time'], storm.dict['lat']\
-, storm.dict['lon'], storm.dict['vmax'])
-        ])
+    # Shares the call with any request for the same key already in flight
+    await in_flight.run(key, lambda: store_weather(key, fetch_upstream, min_ttl=lead))
+    metrics.prefetches.inc(endpoint=endpoint)
+    return True
 
-        # Create an embed to display storm information
-        embed = discord.Embed(
-            title=f"🌀 Hurricane Info: {storm_name.capitalize()} {year}",
-            description=f"Start Date: {start_date}\nEnd Date: {end_date}",
-            color=0x3498db
-        )
-        embed.add_field(name="Category", value=category, inline=True)
-        embed.add_field(name="Duration", value=f"{duration_days} days", inline=True)
-        embed.add_field(name="Accumulated Cyclone Energy (ACE)", value=f"{ace}", inline=True)
-        embed.add_field(name="Max Wind Speed", value=f"{max_wind} knots", inline=True)
-        embed.add_field(name="Min Pressure", value=f"{min_pressure} hPa", inline=True)
-        embed.add_field(name="Storm Track", value=track_message[:0], inline=False)
-
-        # Plot the storm track and save the image
-        plt.figure()
-        storm.plot(
-        domain="dynamic",
-        title=f"Track of {storm_name.capitalize()} ({year})",
-        plot_all_dots=True,
-        color="category"
-        )
-        image_path = f"{storm_name}_{year}_track.png"
-        plt.savefig(image_path, bbox_inches='tight')  # Save the plot to a file
-        plt.close()  # Close the plot to free up memory
+async def warm_location(lat, lon, city_name, lead):
+    """Refresh what /weather and /forecast need for a location and pre-render its charts."""
+    params = {'lat': lat, 'lon': lon, 'appid': weather_api_key, 'units': 'metric'}
+    coord_params = {'lat': lat, 'lon': lon, 'appid': weather_api_key}
+    await asyncio.gather(
+        refresh_weather(f"{api_base}/data/2.5/weather", params, lead),
+        refresh_weather(f"{api_base}/data/2.5/uvi", coord_params, lead),
+        refresh_weather(f"{api_base}/data/2.5/air_pollution", coord_params, lead),
+        refresh_weather(f"{api_base}/data/2.5/forecast", params, lead)
+    )
 
-        # Send the embed
-        await interaction.response.send_message(embed=embed)
-        await interaction.followup.send(file=discord.File(image_path))
+    # Charts only render when a worker is idle, so warming never delays a request
+    if not prefetch_config.get("render_charts", True) or render_pool.shedding or \
+            render_pool.pending >= render_pool.workers:
+        return
+    # Only from a forecast already cached: a miss here would fetch at interactive priority
+    key = weather_cache_key(f"{api_base}/data/2.5/forecast", params)
+    data = weather_cache.get(key)
+    if data:
+        table = forecast_table(key, data)
+        await hourly_chart(city_name, table.hourly(FORECAST_SLOTS))
+        await daily_chart(city_name, table.daily(FORECAST_DAYS))
+
+@tasks.loop(seconds=prefetch_config.get("interval_seconds", 60))
+async def prefetch_task():
+    """Warm the custom cities and the most requested locations before their data expires."""
+    if prefetch_config.get("include_custom_cities", True):
+        location_tracker.pin(settings.current.custom_cities.values())
+    # Leave part of the daily budget untouched for interactive requests
+    headroom = rate_limiter.headroom()
+    reserve = headroom["per_day"] * prefetch_config.get("daily_reserve", 0.2)
+    if headroom["daily_remaining"] < reserve:
+        return
 
-    except ValueError:
-        await interaction.response.send_message("Provide the storm name and year in the format:\
-            /hurricane [Storm Name] [Year]")
-    except KeyError as e:
-        logger.error("Error retrieving cyclone data: %s", e)
-        await interaction.response.send_message("An error occurred")
-    finally:
-        # Clean up image file
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    locations = location_tracker.hot(prefetch_config.get("top_n", 10),
+                                     prefetch_config.get("min_score", 2))
+    lead = prefetch_config.get("refresh_ahead", 120)
+    semaphore = asyncio.Semaphore(prefetch_config.get("max_concurrency", 2))
+
+    async def warm(lat, lon, city_name):
+        async with semaphore:
+            try:
+                await warm_location(lat, lon, city_name, lead)
+            except (RateLimitExceeded, RenderQueueFull) as err:
+                logger.info("Prefetch of %s skipped: %s", city_name, err)
+
+    await asyncio.gather(*(warm(*location) for location in locations))
+
+@prefetch_task.error
+async def prefetch_task_error(error):
+    """Keep the prefetcher alive after an unexpected failure."""
+    logger.exception("Prefetch failed:", exc_info=error)
+
+# Memory watchdog: each process checks itself and its render workers
+memory_config = config.get("memory", {})
+memory_monitor = MemoryMonitor(
+    soft_limit_mb=memory_config.get("soft_limit_mb", 768),
+    hard_limit_mb=memory_config.get("hard_limit_mb", 1024),
+    worker_limit_mb=memory_config.get("worker_limit_mb"),
+    max_figures=memory_config.get("max_figures")
+)
+
+@tasks.loop(seconds=memory_config.get("check_seconds", 30))
+async def memory_monitor_task():
+    """Compare memory and open figures with the limits, recycling workers and shedding load."""
+    worker_bytes = {pid: used for pid, used in \
+        ((pid, memory.memory_bytes(pid)) for pid in render_pool.worker_pids()) if used is not None}
+    figures = charts.open_figures() + sum(render_pool.worker_figures.values())
+    changed = memory_monitor.update(memory.memory_bytes(), worker_bytes, figures)
+    reading = ", ".join(f"{name} {value / 1048576:.0f} MB" for name, value in \
+        memory_monitor.reading.items() if name != "figures") + f", {figures} figures" \
+        if memory_monitor.measured else f"memory unknown, {figures} figures"
+
+    bloated = memory_monitor.bloated_workers()
+    recycle = bool(bloated) or memory_monitor.too_many_figures
+    if recycle:
+        logger.warning("Recycling render workers (%s; over the limit: %s).", reading,
+                       ", ".join(map(str, bloated)) or "figures")
+    if changed and memory_monitor.shedding:
+        logger.warning("Memory over the hard limit (%s); refusing renders and dropping "
+                       "cached charts.", reading)
+        render_pool.shedding = True
+        chart_cache.clear()
+        gc.collect()
+        recycle = True
+    elif changed:
+        logger.info("Memory back under the soft limit (%s); renders resumed.", reading)
+        render_pool.shedding = False
+    elif memory_monitor.over_soft_limit:
+        logger.warning("Memory over the soft limit: %s.", reading)
+    if recycle:
+        render_pool.recycle()
+
+@memory_monitor_task.error
+async def memory_monitor_task_error(error):
+    """Keep the memory watchdog alive after an unexpected failure."""
+    logger.exception("Memory check failed:", exc_info=error)
+
+metrics.registry.gauge("skywatcher_memory_rss_bytes", "Memory (PSS) at the last check.",
+                       ("process",), callback=lambda: {
+                           "main": memory_monitor.reading["main"],
+                           "workers": memory_monitor.reading["workers"]})
+metrics.registry.gauge("skywatcher_open_figures", "Open non-template figures, workers included.",
+                       callback=lambda: memory_monitor.reading["figures"])
+metrics.registry.gauge("skywatcher_load_shedding", "1 while renders are refused for memory.",
+                       callback=lambda: int(memory_monitor.shedding))
 
 # Error handling
+async def report_interaction_error(interaction, error):
+    """Tell the user why an interaction failed, distinguishing rate limiting from bugs."""
+    if isinstance(error, RateLimitExceeded):
+        logger.warning("Rate limited: %s", error)
+        message = rate_limited_message
+    else:
+        logger.exception("Unexpected error:", exc_info=error)
+        message = "An unexpected error occurred. Please try again later."
+    if interaction.response.is_done():
+        await interaction.followup.send(message)
+    else:
+        await interaction.response.send_message(message)
+
+@client.tree.error
+async def on_app_command_error(interaction, error):
+    """Slash command error handler."""
+    record_command(interaction, "error")
+    await report_interaction_error(interaction, getattr(error, 'original', error))
+
 @client.event
 async def on_command_error(ctx, error):
     '''Error handling function'''
@@ -635,4 +1471,5 @@ async def on_command_error(ctx, error):
         logger.exception("Unexpected error:", exc_info=error)
         await ctx.send("An unexpected error occurred. Please try again later.")
 
-client.run(tokencode)
+if __name__ == "__main__":
+    client.run(tokencode)
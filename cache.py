@@ -0,0 +1,180 @@
+"""In-process and on-disk caches for API responses and rendered images."""
+import os
+import re
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            # Expired entries stay until evicted so get_stale() can still fall back on them
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key):
+        """Return the value for key even if it has expired, or None if it was never cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stale_hits += 1
+        return entry[0]
+
+    def expires_in(self, key):
+        """Seconds until key expires, or 0 if it is missing or already expired.
+
+        Doesn't count as a lookup or refresh the entry's recency.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0
+        return max(0.0, entry[1] - time.monotonic())
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds, evicting least recently used entries."""
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry while keeping the counters."""
+        self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class ByteBudgetCache:
+    """LRU cache of byte strings bounded by their total size rather than entry count."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached bytes for key, or None if missing."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store value under key, evicting least recently used entries to stay in budget."""
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= len(previous)
+        self._entries[key] = value
+        self.current_bytes += len(value)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry while keeping the counters."""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and memory usage."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class DiskImageCache:
+    """Directory of rendered images that persists across restarts, keyed by a stable ID."""
+
+    def __init__(self, directory, version="v1", extension="png"):
+        self.directory = directory
+        self.version = version
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        """Return the file path used for key."""
+        safe_key = re.sub(r'[^A-Za-z0-9_-]+', '_', str(key))
+        return os.path.join(self.directory, f"{safe_key}_{self.version}.{self.extension}")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def get(self, key):
+        """Return the stored bytes for key, or None if it has not been rendered yet."""
+        try:
+            with open(self.path_for(key), 'rb') as image_file:
+                data = image_file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def set(self, key, value):
+        """Atomically write value for key."""
+        path = self.path_for(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as image_file:
+            image_file.write(value)
+        os.replace(temp_path, path)
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored images."""
+        return {
+            "size": sum(1 for name in os.listdir(self.directory) \
+                if name.endswith("." + self.extension)),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,442 @@
+"""Chart rendering for SKYWATCHER, run inside worker processes."""
+import io
+import os
+import json
+import asyncio
+import hashlib
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # pylint: disable=wrong-import-position
+
+class RenderQueueFull(Exception):
+    """Raised when too many charts are already waiting for a render worker."""
+
+class RenderPool:
+    """Process pool that renders charts off the event loop with a bounded queue."""
+
+    def __init__(self, workers=None, max_pending=16, queue_timeout=10, output=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        # Keyword arguments for configure_output in every worker
+        self.output = dict(output or {})
+        self.pending = 0
+        # Set by the memory monitor to refuse new renders while memory is short
+        self.shedding = False
+        # Open figures reported by each worker after its last render
+        self.worker_figures = {}
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor = None
+
+    def start(self):
+        """Create the worker processes."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=worker_context(),
+                initializer=partial(configure_output, **self.output))
+
+    def shutdown(self):
+        """Stop the workers, dropping any queued renders."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.worker_figures.clear()
+
+    def recycle(self):
+        """Replace the workers with fresh processes, returning their memory to the system.
+
+        Renders already handed to the old workers still finish there.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.worker_figures.clear()
+        self.start()
+
+    def worker_pids(self):
+        """Process IDs of the current workers."""
+        if self._executor is None:
+            return []
+        return list(self._executor._processes or {})  # pylint: disable=protected-access
+
+    async def render(self, func, *args):
+        """Run a render function in a worker and return its image bytes.
+
+        Waits for a free queue slot for up to queue_timeout seconds, then raises
+        RenderQueueFull so callers can shed load instead of piling up work. While
+        shedding is set it raises straight away.
+        """
+        if self.shedding:
+            raise RenderQueueFull("shedding load while memory is short")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError as exc:
+            raise RenderQueueFull(f"{self.pending} charts already queued") from exc
+        self.pending += 1
+        try:
+            self.start()
+            loop = asyncio.get_running_loop()
+            image, pid, figures = await loop.run_in_executor(
+                self._executor, _run_render, func, *args)
+            self.worker_figures[pid] = figures
+            return image
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+def worker_context():
+    """Start workers from a clean process rather than forking the running bot.
+
+    By the time a pool starts the bot has threads that may hold locks mid-fork. The fork
+    server imports the main module and this one once, before any thread exists, so its
+    workers skip importing them again and share those pages with each other.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["__main__", __name__])
+    return context
+
+def _run_render(func, *args):
+    """Worker entry point: render, then close every figure except the templates.
+
+    A render that raises halfway, such as a Cartopy failure inside tropycal, would
+    otherwise leave its figure open in the worker for good. Returns (image, pid,
+    open_figures) so the pool can watch for leaks.
+    """
+    try:
+        image = func(*args)
+    finally:
+        close_stray_figures()
+    return image, os.getpid(), open_figures()
+
+def close_stray_figures():
+    """Close every open figure of this process that isn't a reusable template."""
+    kept = {template.fig.number for template in _templates.values()}
+    for number in plt.get_fignums():
+        if number not in kept:
+            plt.close(number)
+
+def open_figures():
+    """Number of matplotlib figures open in this process, not counting the templates.
+
+    Templates are kept on purpose and bounded by _template(), so only the rest can leak.
+    """
+    return len(plt.get_fignums()) - len(_templates)
+
+def chart_digest(func, *args):
+    """Digest a render function and its input series into a stable cache key."""
+    payload = json.dumps([func.__name__, args], default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+# How this process encodes images; RenderPool sets it in every worker
+_output = {"format": "png", "dpi": None, "optimize": False, "quality": 80}
+
+def configure_output(image_format="png", dpi=None, optimize=False, quality=80):
+    """Choose the image format, resolution and compression for charts rendered here."""
+    if image_format not in ("png", "webp"):
+        raise ValueError(f"unsupported chart format {image_format!r}")
+    _output.update(format=image_format, dpi=dpi, optimize=optimize, quality=quality)
+
+def _encode(fig, bbox_inches='tight'):
+    """Serialize a figure with this process's output settings."""
+    buffer = io.BytesIO()
+    if _output["format"] == "webp":
+        pil_kwargs = {"quality": _output["quality"]}
+    elif _output["optimize"]:
+        # Quickly compressed here, as the image is re-encoded below anyway
+        pil_kwargs = {"compress_level": 1}
+    else:
+        pil_kwargs = None
+    fig.savefig(buffer, format=_output["format"], dpi=_output["dpi"] or "figure",
+                bbox_inches=bbox_inches, pil_kwargs=pil_kwargs)
+    if _output["format"] == "png" and _output["optimize"]:
+        return _quantize_png(buffer)
+    return buffer.getvalue()
+
+def _quantize_png(buffer):
+    """Re-encode a PNG with a 256-colour palette, which charts' flat colours survive intact."""
+    buffer.seek(0)
+    with Image.open(buffer) as image:
+        palette = image.convert("RGB").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    output = io.BytesIO()
+    palette.save(output, format="png")
+    return output.getvalue()
+
+def _figure_to_image(fig):
+    """Serialize a one-off figure and close it."""
+    try:
+        return _encode(fig)
+    finally:
+        plt.close(fig)
+
+class ChartTemplate:
+    """A figure laid out once per worker and reused for every chart of its kind.
+
+    Building axes, legends and the tight layout is most of the cost of a chart and is
+    the same for every request, so subclasses create their artists once with
+    placeholder data and render() only swaps in the new series, labels and title.
+    The layout is computed with the widest expected tick labels and then frozen.
+    """
+
+    # Longest tick label the layout must leave room for
+    widest_label = ""
+
+    def __init__(self, points):
+        self.points = points
+        self.x = np.arange(points)
+        self.fig = self.build(np.zeros(points))
+        self.fig.canvas.draw()
+        renderer = self.fig.canvas.get_renderer()
+        # Equivalent of bbox_inches='tight' without measuring every render again
+        self.bbox = self.fig.get_tightbbox(renderer).padded(
+            matplotlib.rcParams['savefig.pad_inches'])
+
+    def build(self, zeros):
+        """Create the figure and its artists from placeholder data; returns the figure."""
+        raise NotImplementedError
+
+    @staticmethod
+    def set_bars(bars, heights):
+        """Resize a bar container in place."""
+        for bar, height in zip(bars, heights):
+            bar.set_height(np.nan_to_num(height))
+
+    @staticmethod
+    def rescale(*axes):
+        """Refit the data limits of axes after their artists changed."""
+        for ax in axes:
+            ax.relim()
+            ax.autoscale_view()
+
+    def encode(self):
+        """Serialize the figure with the frozen layout."""
+        return _encode(self.fig, bbox_inches=self.bbox)
+
+# Templates of this process, keyed by (template class, number of points)
+_templates = {}
+
+def _template(template_class, points):
+    """Return this process's template for a chart kind and length, building it on first use."""
+    key = (template_class, points)
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) >= 8:
+            plt.close(_templates.pop(next(iter(_templates))).fig)
+        template = _templates[key] = template_class(points)
+    return template
+
+class HourlyChart(ChartTemplate):
+    """Template of the 3-hour forecast chart."""
+
+    widest_label = "Sep 30, 23:00"
+
+    def build(self, zeros):
+        fig, ax1 = plt.subplots(figsize=(14, 7))
+        self.ax1 = ax1
+
+        # Plot temperature and feels-like temperature
+        self.temps, = ax1.plot(self.x, zeros, marker='o', color='red', label='Temperature (°C)')
+        self.feels_like, = ax1.plot(self.x, zeros, marker='x', color='orange', linestyle='--', \
+            label='Feels Like (°C)')
+        ax1.set_ylabel('Temperature (°C)', color='red')
+        ax1.tick_params(axis='y', labelcolor='red')
+
+        # Plot rain probability and rain amount as bars
+        self.pops = ax1.bar(self.x, zeros, alpha=0.2, color='cyan', \
+            label='Rain Probability (%)', width=0.5)
+        self.rain = ax1.bar(self.x, zeros, alpha=0.4, color='blue', \
+            label='Rain Amount (mm)', width=0.3)
+
+        # Create a secondary axis for humidity and wind speed
+        self.ax2 = ax2 = ax1.twinx()
+        self.humidity, = ax2.plot(self.x, zeros, marker='^', linestyle='--', color='blue', \
+            label='Humidity (%)')
+        self.wind, = ax2.plot(self.x, zeros, marker='s', linestyle='-', color='green', \
+            label='Wind Speed (m/s)')
+        ax2.set_ylabel('Humidity (%) / Wind Speed (m/s)', color='blue')
+        ax2.tick_params(axis='y', labelcolor='blue')
+
+        # Adjust x-axis labels to avoid overlapping
+        ax1.set_xticks(self.x, [self.widest_label] * self.points, rotation=45, ha="right",
+                       fontsize=10)
+
+        # Title and legend adjustments for better visibility
+        self.title = ax2.set_title("Hourly Weather Forecast", fontsize=16)
+        fig.legend(loc='upper center', bbox_to_anchor=(0.5, 1.12), fontsize=10, ncol=3)
+
+        # Add a grid for better readability
+        ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+
+        fig.tight_layout()
+        return fig
+
+    def render(self, city_name, times, temps, feels_like_temps, humidities,
+               wind_speeds, rain_amounts, pops):
+        """Draw one forecast into the template and return the encoded image."""
+        self.temps.set_ydata(temps)
+        self.feels_like.set_ydata(feels_like_temps)
+        self.humidity.set_ydata(humidities)
+        self.wind.set_ydata(wind_speeds)
+        self.set_bars(self.pops, pops)
+        self.set_bars(self.rain, rain_amounts)
+        self.ax1.set_xticklabels(times)
+        self.title.set_text(f"Hourly Weather Forecast for the Next 36 Hours in {city_name}")
+        self.rescale(self.ax1, self.ax2)
+        return self.encode()
+
+class DailyChart(ChartTemplate):
+    """Template of the 6-day forecast chart."""
+
+    widest_label = "September 30, 2025"
+
+    def build(self, zeros):
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True)
+        self.ax1, self.ax2 = ax1, ax2
+
+        # Subplot 1: Temperature (Min, Max, Feels-Like)
+        self.max_temps = ax1.bar(self.x, zeros, color='#FF4500', alpha=0.7, \
+            label='Max Temperature (°C)', width=0.4)
+        self.min_temps = ax1.bar(self.x, zeros, color='#FFA500', alpha=0.7, \
+            label='Min Temperature (°C)', width=0.4)
+        self.feels_like, = ax1.plot(self.x, zeros, marker='o', linestyle='--', \
+            color='darkred', label='Feels Like Avg (°C)', linewidth=2)
+        ax1.set_ylabel('Temperature (°C)', color='red')
+        ax1.tick_params(axis='y', labelcolor='red')
+        ax1.legend(loc='upper left', fontsize=9)
+
+        # Subplot 2: Rain Probability, Rain Amount, Humidity, Wind Speed
+        self.pops = ax2.bar(self.x - 0.2, zeros, alpha=0.2, \
+            color='cyan', label='Rain Probability (%)', width=0.4, hatch='//')
+        self.rain = ax2.bar(self.x + 0.2, zeros, alpha=0.4, \
+            color='navy', label='Total Rain Amount (mm)', width=0.4)
+        self.humidity, = ax2.plot(self.x, zeros, marker='^', linestyle='--', \
+            color='blue', label='Humidity (%)', linewidth=1.5)
+        self.wind, = ax2.plot(self.x, zeros, marker='s', linestyle='-', \
+            color='green', label='Wind Speed (m/s)', linewidth=2)
+        ax2.set_ylabel('Rainfall (mm)\nHumidity (%) / Wind Speed (m/s)', color='blue')
+        ax2.tick_params(axis='y', labelcolor='blue')
+        ax2.legend(loc='upper left', fontsize=9)
+
+        # Set the x-axis label for the entire figure
+        ax2.set_xticks(self.x, [self.widest_label] * self.points, rotation=45, ha="right",
+                       fontsize=10)
+        ax2.set_xlabel('Date', fontsize=12)
+
+        # Title for the entire figure
+        self.title = fig.suptitle("6-Day Weather Forecast", fontsize=16)
+
+        # Adjust layout for better readability
+        fig.tight_layout(rect=[0, 0, 1, 0.95])
+
+        # Add a grid for better readability
+        ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+        ax2.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+        return fig
+
+    def render(self, city_name, dates, min_temps, max_temps, avg_feels_like, avg_humidity,
+               avg_wind_speed, total_rain, avg_pop):
+        """Draw one forecast into the template and return the encoded image."""
+        self.set_bars(self.max_temps, max_temps)
+        self.set_bars(self.min_temps, min_temps)
+        self.feels_like.set_ydata(avg_feels_like)
+        self.set_bars(self.pops, avg_pop)
+        self.set_bars(self.rain, total_rain)
+        self.humidity.set_ydata(avg_humidity)
+        self.wind.set_ydata(avg_wind_speed)
+        self.ax2.set_xticklabels(dates)
+        self.title.set_text(f"6-Day Weather Forecast - {city_name}")
+        self.rescale(self.ax1, self.ax2)
+        return self.encode()
+
+def render_hourly_chart(city_name, times, temps, feels_like_temps, humidities,
+                        wind_speeds, rain_amounts, pops):
+    """Render the 3-hour forecast chart and return the image bytes."""
+    return _template(HourlyChart, len(times)).render(
+        city_name, times, temps, feels_like_temps, humidities, wind_speeds, rain_amounts, pops)
+
+def render_daily_chart(city_name, dates, min_temps, max_temps, avg_feels_like, avg_humidity,
+                       avg_wind_speed, total_rain, avg_pop):
+    """Render the 6-day forecast chart and return the image bytes."""
+    return _template(DailyChart, len(dates)).render(
+        city_name, dates, min_temps, max_temps, avg_feels_like, avg_humidity,
+        avg_wind_speed, total_rain, avg_pop)
+
+def render_compare_chart(city_names, temps, feels_like_temps, humidities, wind_speeds):
+    """Render current conditions of several cities side by side and return PNG bytes."""
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(max(8, 2 * len(city_names)), 9), sharex=True)
+    x_indices = range(len(city_names))
+
+    # Subplot 1: Temperature and feels-like temperature per city
+    ax1.bar([x - 0.2 for x in x_indices], temps, color='#FF4500', alpha=0.7, \
+        label='Temperature (°C)', width=0.4)
+    ax1.bar([x + 0.2 for x in x_indices], feels_like_temps, color='#FFA500', alpha=0.7, \
+        label='Feels Like (°C)', width=0.4)
+    ax1.set_ylabel('Temperature (°C)', color='red')
+    ax1.tick_params(axis='y', labelcolor='red')
+
+    # Subplot 2: Humidity on the left axis, wind speed on the right
+    ax2.bar(x_indices, humidities, color='blue', alpha=0.3, label='Humidity (%)', width=0.5)
+    ax2.set_ylabel('Humidity (%)', color='blue')
+    ax2.tick_params(axis='y', labelcolor='blue')
+    ax3 = ax2.twinx()
+    ax3.plot(x_indices, wind_speeds, marker='s', linestyle='None', markersize=10, \
+        color='green', label='Wind Speed (m/s)')
+    ax3.set_ylim(bottom=0)
+    ax3.set_ylabel('Wind Speed (m/s)', color='green')
+    ax3.tick_params(axis='y', labelcolor='green')
+    fig.legend(loc='lower center', fontsize=9, ncol=4)
+
+    ax2.set_xticks(list(x_indices))
+    ax2.set_xticklabels(city_names, rotation=30, ha="right", fontsize=10)
+    fig.suptitle("Current Weather Comparison", fontsize=16)
+    fig.tight_layout(rect=[0, 0.05, 1, 0.95])
+
+    ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+    ax2.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+
+    return _figure_to_image(fig)
+
+def render_season_chart(label, years, ace, counts, categories):
+    """Render ACE and storm counts by category per season and return PNG bytes."""
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(max(8, 0.25 * len(years)), 8), sharex=True)
+
+    # Subplot 1: Accumulated cyclone energy per season
+    ax1.bar(years, ace, color='#3498db', alpha=0.8, width=0.8)
+    ax1.set_ylabel('ACE (10⁴ kt²)', color='#3498db')
+    ax1.tick_params(axis='y', labelcolor='#3498db')
+
+    # Subplot 2: Storms per season, stacked by category
+    colors = ('#95a5a6', '#2ecc71', '#f39c12', '#c0392b')
+    bottom = [0] * len(years)
+    for category, color, column in zip(categories, colors, zip(*counts)):
+        ax2.bar(years, column, bottom=bottom, color=color, label=category, width=0.8)
+        bottom = [total + count for total, count in zip(bottom, column)]
+    ax2.set_ylabel('Storms')
+    ax2.set_xlabel('Season')
+    ax2.legend(loc='upper left', fontsize=9, ncol=2)
+
+    fig.suptitle(f"Tropical Cyclone Seasons {label}", fontsize=16)
+    fig.tight_layout(rect=[0, 0, 1, 0.96])
+
+    ax1.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+    ax2.grid(visible=True, which='both', linestyle='--', linewidth=0.5)
+
+    return _figure_to_image(fig)
+
+def render_storm_track(storm_dict, title):
+    """Render a Cartopy storm track map from a TrackDataset storm dict and return PNG bytes."""
+    import tropycal.tracks as tracks  # pylint: disable=import-outside-toplevel
+    storm = tracks.Storm(storm_dict)
+    ax = storm.plot(
+        domain="dynamic",
+        title=title,
+        plot_all_dots=True,
+        color="category"
+    )
+    return _figure_to_image(ax.figure)
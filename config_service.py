@@ -0,0 +1,163 @@
+"""Hot-reloadable configuration: config.json compiled into immutable snapshots."""
+import os
+import json
+import time
+import asyncio
+import logging
+from types import MappingProxyType
+from levels import compile_levels
+from alerts import ALERT_TYPES, AlertEvaluator
+
+logger = logging.getLogger('discord_bot')
+
+# Sections that only take effect at startup; changing them still needs a restart
+STARTUP_SECTIONS = ("http", "rate_limit", "cache", "geocode", "render", "storms", "alerts",
+                    "compare", "responses", "prefetch", "sharding", "shared_cache", "memory",
+                    "metrics", "reload")
+
+class ConfigError(Exception):
+    """Raised when config.json is missing a section or has a malformed value."""
+
+def freeze(value):
+    """Return a read-only deep copy: dicts become mapping proxies and lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def normalize_city(city):
+    """Normalize a city name so spacing and case variants match."""
+    return " ".join(city.lower().split())
+
+class ConfigSnapshot:
+    """One validated, read-only version of config.json with its lookup structures built.
+
+    Handlers read bot.settings.current once and keep using that snapshot, so a reload
+    never changes the configuration halfway through a request.
+    """
+
+    __slots__ = ("raw", "version", "weather_emojis", "custom_cities", "statuses",
+                 "level_tables", "warning_messages", "aqi_levels", "aqi_colors",
+                 "aqi_warning_messages", "alert_evaluator", "commands", "problems")
+
+    def __init__(self, raw, version=0):
+        try:
+            self.raw = freeze(raw)
+            self.version = version
+            self.weather_emojis = MappingProxyType(
+                {description.lower(): emoji for description, emoji in raw["weather_emojis"].items()})
+            self.custom_cities = MappingProxyType({
+                normalize_city(city): (float(location["lat"]), float(location["lon"]),
+                                       normalize_city(city).title())
+                for city, location in raw["custom_cities"].items()
+            })
+            self.statuses = tuple(raw["statuses"])
+            self.level_tables = MappingProxyType(compile_levels(raw))
+            self.warning_messages = MappingProxyType(
+                {name: raw["warnings"][name] for name in ALERT_TYPES if name != "aqi"})
+            self.aqi_levels = tuple(raw["aqi_levels"])
+            self.aqi_colors = tuple(raw["aqi_colors"])
+            self.aqi_warning_messages = tuple(
+                raw.get("aqi_warnings", {}).get(level.lower().replace(" ", "_"))
+                for level in self.aqi_levels
+            )
+            self.alert_evaluator = AlertEvaluator(
+                raw, aqi_min=raw.get("alerts", {}).get("aqi_min", 3))
+            self.commands = tuple(raw["commands"].items())
+        except KeyError as err:
+            raise ConfigError(f"missing config entry {err}") from err
+        except (TypeError, ValueError, AttributeError) as err:
+            raise ConfigError(f"malformed config: {err}") from err
+
+        if not self.statuses:
+            raise ConfigError("statuses must not be empty")
+        if len(self.aqi_colors) < len(self.aqi_levels):
+            raise ConfigError("aqi_colors needs one color per aqi level")
+        for name in ("temperature", "humidity", "wind", "uv", "rain"):
+            if name not in self.level_tables:
+                raise ConfigError(f"missing config entry '{name}_levels'")
+        self.problems = tuple(problem for table in self.level_tables.values()
+                              for problem in table.problems)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "problems"):
+            raise AttributeError("ConfigSnapshot is read-only")
+        object.__setattr__(self, name, value)
+
+class ConfigService:
+    """Watches config.json and atomically swaps in a new snapshot when it changes.
+
+    A broken edit is logged and ignored, so the bot keeps running on the last good
+    snapshot. Reading and compiling happen in a worker thread off the request path.
+    """
+
+    def __init__(self, path, poll_seconds=5):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.reloads = 0
+        self.failures = 0
+        self._signature = self._stat()
+        self.current = self._load(version=0)
+        self._task = None
+
+    def _stat(self):
+        """Return (mtime, size) of the config file, or None if it cannot be read."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, version):
+        """Read, validate and compile the config file into a snapshot."""
+        with open(self.path, 'r', encoding='utf-8') as config_file:
+            snapshot = ConfigSnapshot(json.load(config_file), version)
+        for problem in snapshot.problems:
+            logger.warning("Level config: %s", problem)
+        return snapshot
+
+    def reload_if_changed(self):
+        """Swap in a new snapshot if the file changed; returns whether it did."""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        started = time.perf_counter()
+        try:
+            snapshot = self._load(self.current.version + 1)
+        except (OSError, ValueError, ConfigError) as err:
+            self.failures += 1
+            logger.error("Ignoring invalid config change in %s: %s", self.path, err)
+            return False
+
+        changed = [section for section in STARTUP_SECTIONS
+                   if snapshot.raw.get(section) != self.current.raw.get(section)]
+        if changed:
+            logger.warning("Config sections %s changed; they take effect after a restart.",
+                           ", ".join(changed))
+        # A single reference assignment, so readers see either the old or the new snapshot
+        self.current = snapshot
+        self.reloads += 1
+        logger.info("Loaded config version %d in %.1f ms.", snapshot.version,
+                    (time.perf_counter() - started) * 1000)
+        return True
+
+    def start(self):
+        """Begin polling the file for changes from the running event loop."""
+        if self._task is None and self.poll_seconds:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    def stop(self):
+        """Stop polling for changes."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Config reload failed")
@@ -0,0 +1,77 @@
+"""Vectorized processing of OpenWeather /forecast payloads."""
+import datetime
+import numpy as np
+
+class ForecastTable:
+    """A /forecast payload parsed once into NumPy columns and shared by every forecast view."""
+
+    def __init__(self, payload):
+        entries = payload.get('list', [])
+        local_times = [datetime.datetime.fromtimestamp(entry['dt']) for entry in entries]
+
+        self.timestamps = np.array([entry['dt'] for entry in entries], dtype=np.int64)
+        self.temp = np.array([entry['main']['temp'] for entry in entries], dtype=float)
+        self.feels_like = np.array([entry['main']['feels_like'] for entry in entries], dtype=float)
+        self.humidity = np.array([entry['main']['humidity'] for entry in entries], dtype=float)
+        self.wind_speed = np.array([entry['wind']['speed'] for entry in entries], dtype=float)
+        self.clouds = np.array([entry.get('clouds', {}).get('all', 0) for entry in entries],
+                               dtype=float)
+        self.pop = np.array([entry.get('pop', 0) for entry in entries], dtype=float) * 100
+        self.rain = np.array([entry.get('rain', {}).get('3h', 0) for entry in entries], dtype=float)
+        self.descriptions = [entry['weather'][0]['description'] for entry in entries]
+        self.labels = [local_time.strftime("%b %d, %H:%M") for local_time in local_times]
+
+        # Entries arrive in time order, so each local day is one contiguous run
+        self.day_ordinals = np.array([local_time.toordinal() for local_time in local_times],
+                                     dtype=np.int64)
+        self.day_starts = np.flatnonzero(np.diff(self.day_ordinals, prepend=-1)) \
+            if len(entries) else np.empty(0, dtype=np.int64)
+        self.day_labels = [local_times[start].strftime("%B %d, %Y") for start in self.day_starts]
+        self._daily = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def hourly(self, count=12):
+        """Return the first count 3-hour slots as plain lists."""
+        window = slice(0, count)
+        return {
+            "times": self.labels[window],
+            "temps": self.temp[window].tolist(),
+            "feels_like": self.feels_like[window].tolist(),
+            "humidity": self.humidity[window].tolist(),
+            "wind_speed": self.wind_speed[window].tolist(),
+            "clouds": self.clouds[window].tolist(),
+            "pop": self.pop[window].astype(int).tolist(),
+            "rain": self.rain[window].tolist(),
+            "descriptions": self.descriptions[window]
+        }
+
+    def daily(self, days=6):
+        """Return per-day reductions for the first days local days as plain lists."""
+        if self._daily is None:
+            self._daily = self._reduce_days()
+        return {name: values[:days] for name, values in self._daily.items()}
+
+    def _reduce_days(self):
+        """Compute every per-day reduction in one vectorized pass over the columns."""
+        if not len(self):
+            return {name: [] for name in ("dates", "min_temp", "max_temp", "feels_like",
+                                          "humidity", "wind_speed", "rain", "pop")}
+        starts = self.day_starts
+        counts = np.diff(np.append(starts, len(self)))
+        sums = np.add.reduceat(
+            np.vstack((self.feels_like, self.humidity, self.wind_speed, self.rain, self.pop)),
+            starts, axis=1
+        )
+        means = sums / counts
+        return {
+            "dates": self.day_labels,
+            "min_temp": np.minimum.reduceat(self.temp, starts).tolist(),
+            "max_temp": np.maximum.reduceat(self.temp, starts).tolist(),
+            "feels_like": means[0].tolist(),
+            "humidity": means[1].tolist(),
+            "wind_speed": means[2].tolist(),
+            "rain": sums[3].tolist(),
+            "pop": means[4].tolist()
+        }
@@ -0,0 +1,104 @@
+"""Persistent city-name geocoding index backed by SQLite."""
+import os
+import time
+import sqlite3
+import threading
+
+class GeocodeIndex:
+    """Normalized city name -> (lat, lon, name, country) index, mirrored in memory.
+
+    Several bot processes may share one database file; entries another process stored
+    after this one warmed up are read from disk on a memory miss. lookup() and store()
+    may wait on the database, so call them from a worker thread; cached() answers
+    memory hits without it.
+    """
+
+    def __init__(self, path, negative_ttl=86400):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "query TEXT PRIMARY KEY, lat REAL, lon REAL, name TEXT, country TEXT, "
+            "found INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.warm()
+
+    @staticmethod
+    def normalize(city):
+        """Normalize a city name so spacing and case variants share one entry."""
+        return " ".join(city.lower().split())
+
+    def warm(self):
+        """Load every past lookup from disk into memory."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query, lat, lon, name, country, found, updated_at FROM geocode"
+            ).fetchall()
+        for query, lat, lon, name, country, found, updated_at in rows:
+            location = (lat, lon, name, country) if found else None
+            self._entries[query] = (location, updated_at)
+        return len(rows)
+
+    def _read(self, query):
+        """Return (location, updated_at) for query from disk, or None if never stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lat, lon, name, country, found, updated_at FROM geocode WHERE query = ?",
+                (query,)
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lon, name, country, found, updated_at = row
+        return ((lat, lon, name, country) if found else None), updated_at
+
+    def _result(self, entry):
+        """Turn a (location, updated_at) entry into (known, location)."""
+        location, updated_at = entry
+        if location is None and time.time() - updated_at > self.negative_ttl:
+            return False, None
+        return True, location
+
+    def cached(self, city):
+        """Return (known, location) from memory alone, or None if lookup() must read disk.
+
+        Never touches the database, so it is safe to call on the event loop.
+        """
+        entry = self._entries.get(self.normalize(city))
+        return self._result(entry) if entry is not None else None
+
+    def lookup(self, city):
+        """Return (known, location); location is None for a cached negative result."""
+        query = self.normalize(city)
+        entry = self._entries.get(query)
+        if entry is None:
+            entry = self._read(query)
+            if entry is None:
+                return False, None
+            self._entries[query] = entry
+        return self._result(entry)
+
+    def store(self, city, location):
+        """Remember a lookup result; pass None to record that the city does not exist."""
+        query = self.normalize(city)
+        updated_at = time.time()
+        self._entries[query] = (location, updated_at)
+        lat, lon, name, country = location if location is not None else (None, None, None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query, lat, lon, name, country, int(location is not None), updated_at)
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,68 @@
+"""Level tables from config.json compiled into sorted bounds for bisection."""
+import math
+import bisect
+import numpy as np
+
+UNKNOWN = "Unknown"
+
+class LevelTable:
+    """One *_levels config section, classified by bisecting the bands' upper bounds.
+
+    Bands are ordered by their max, so a value belongs to the first band whose max is at
+    least the value; a value on a boundary shared by two bands goes to the lower one.
+    Values falling in a gap between bands go to the band above the gap.
+    """
+
+    def __init__(self, name, bands, gap_tolerance=0.01):
+        self.name = name
+        ordered = sorted(bands.items(), key=lambda item: (item[1].get('max', math.inf),
+                                                          item[1].get('min', -math.inf)))
+        self.keys = tuple(key for key, _ in ordered)
+        self.labels = tuple(bounds['description'] for _, bounds in ordered)
+        self.lower = np.array([bounds.get('min', -math.inf) for _, bounds in ordered], dtype=float)
+        self.upper = np.array([bounds.get('max', math.inf) for _, bounds in ordered], dtype=float)
+        # bisect on a plain list beats a NumPy call for one scalar
+        self._upper_list = self.upper.tolist()
+        self._floor = self.lower[0] if len(self.lower) else math.inf
+        self._label_array = np.array(self.labels + (UNKNOWN,), dtype=object)
+        self.problems = self._check(gap_tolerance)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _check(self, gap_tolerance):
+        """Describe gaps wider than gap_tolerance and overlaps between neighbouring bands."""
+        problems = []
+        for below, above in zip(range(len(self) - 1), range(1, len(self))):
+            gap = self.lower[above] - self.upper[below]
+            if gap < 0:
+                problems.append(f"{self.name}: '{self.keys[below]}' (max {self.upper[below]:g}) "
+                                f"overlaps '{self.keys[above]}' (min {self.lower[above]:g})")
+            elif gap > gap_tolerance + 1e-9:
+                problems.append(f"{self.name}: gap between '{self.keys[below]}' "
+                                f"(max {self.upper[below]:g}) and '{self.keys[above]}' "
+                                f"(min {self.lower[above]:g})")
+        return problems
+
+    def classify(self, value):
+        """Return the description of the band containing value, or Unknown."""
+        if value is None or value != value or value < self._floor:
+            return UNKNOWN
+        index = bisect.bisect_left(self._upper_list, value)
+        return self.labels[index] if index < len(self.labels) else UNKNOWN
+
+    def classify_many(self, values):
+        """Classify an array of values at once; NaN and out-of-range values are Unknown."""
+        values = np.asarray(values, dtype=float)
+        index = np.searchsorted(self.upper, values, side='left')
+        with np.errstate(invalid='ignore'):
+            index[np.isnan(values) | (values < self._floor)] = len(self.labels)
+        return self._label_array[index]
+
+def compile_levels(config, gap_tolerance=0.01):
+    """Compile every '<name>_levels' band table in config, keyed by name."""
+    return {
+        section[:-len("_levels")]: LevelTable(section, bands, gap_tolerance)
+        for section, bands in config.items()
+        if section.endswith("_levels") and isinstance(bands, dict)
+    }
@@ -0,0 +1,86 @@
+"""Memory of the bot and its render workers, checked against configured limits."""
+import os
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def memory_bytes(pid="self"):
+    """Current proportional set size of a process, or None if it cannot be read.
+
+    PSS splits each page shared between processes across them, so the PSS of the bot
+    and its workers adds up to what they really use together; summed RSS would count
+    shared library pages once per process. Falls back to RSS on kernels without
+    smaps_rollup. Reads /proc, so this is None off Linux. The peak from getrusage() is
+    no substitute: it never goes down, so shedding started on it would never stop.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r', encoding='ascii') as rollup:
+            for line in rollup:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/{pid}/statm", 'r', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemoryMonitor:
+    """Compares memory readings with soft and hard limits and decides when to shed load.
+
+    Above the soft limit usage is only reported. Above the hard limit, or with more open
+    figures than allowed, the monitor starts shedding load and keeps shedding until usage
+    is back under the soft limit, so it doesn't flap around a single threshold. When
+    memory can't be measured only the figure count decides.
+    """
+
+    def __init__(self, soft_limit_mb=768, hard_limit_mb=1024, worker_limit_mb=None,
+                 max_figures=None):
+        self.soft_limit = soft_limit_mb * 1024 * 1024
+        self.hard_limit = hard_limit_mb * 1024 * 1024
+        self.worker_limit = worker_limit_mb * 1024 * 1024 if worker_limit_mb else None
+        self.max_figures = max_figures
+        self.shedding = False
+        self.measured = False
+        self.reading = {"main": 0, "workers": 0, "figures": 0}
+        self._worker_bytes = {}
+
+    @property
+    def total(self):
+        """Memory of the bot and its workers at the last reading."""
+        return self.reading["main"] + self.reading["workers"]
+
+    @property
+    def over_soft_limit(self):
+        """Whether the last reading was above the soft limit."""
+        return self.measured and self.total > self.soft_limit
+
+    @property
+    def too_many_figures(self):
+        """Whether more figures were open at the last reading than allowed."""
+        return self.max_figures is not None and self.reading["figures"] > self.max_figures
+
+    def bloated_workers(self):
+        """Workers above the per-worker limit at the last reading."""
+        if self.worker_limit is None:
+            return []
+        return [pid for pid, used in self._worker_bytes.items() if used > self.worker_limit]
+
+    def update(self, main_bytes, worker_bytes, figures):
+        """Record a reading; returns whether shedding started or stopped because of it.
+
+        main_bytes is None when this process's memory can't be measured. worker_bytes maps
+        worker process IDs to their memory in bytes.
+        """
+        self.measured = main_bytes is not None
+        self._worker_bytes = dict(worker_bytes)
+        self.reading = {"main": main_bytes or 0, "workers": sum(self._worker_bytes.values()),
+                        "figures": figures}
+        over_hard_limit = self.measured and self.total > self.hard_limit
+        if not self.shedding and (over_hard_limit or self.too_many_figures):
+            self.shedding = True
+            return True
+        if self.shedding and not self.over_soft_limit and not self.too_many_figures:
+            self.shedding = False
+            return True
+        return False
@@ -0,0 +1,213 @@
+"""Prometheus-style metrics and stage latency instrumentation for SKYWATCHER."""
+import time
+import bisect
+import asyncio
+import logging
+import contextlib
+import contextvars
+from aiohttp import web
+
+logger = logging.getLogger('discord_bot')
+
+# Name of the command being served by the current task, used to label stage timings
+current_command = contextvars.ContextVar('current_command', default='background')
+# Per-request {stage: seconds} totals, set by whoever wants a breakdown of one request
+current_stages = contextvars.ContextVar('current_stages', default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the series identified by labels."""
+        key = tuple(str(labels[name]) for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Yield (suffix, label string, value) for exposition."""
+        for key, value in self._values.items():
+            yield "", _format_labels(self.labels, key), value
+
+class Gauge:
+    """Value that goes up and down, either set directly or read from a callback."""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=(), callback=None):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, **labels):
+        """Set the series identified by labels."""
+        self._values[tuple(str(labels[name]) for name in self.labels)] = value
+
+    def samples(self):
+        """Yield (suffix, label string, value) for exposition."""
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in values.items():
+                key = key if isinstance(key, tuple) else (key,)
+                yield "", _format_labels(self.labels, key), value
+        for key, value in self._values.items():
+            yield "", _format_labels(self.labels, key), value
+
+class Histogram:
+    """Cumulative latency histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        """Record one observation in the series identified by labels."""
+        key = tuple(str(labels[name]) for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile from the bucket counts (upper bucket bound)."""
+        series = self._series.get(tuple(str(labels[name]) for name in self.labels))
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), series[0]):
+            running += count
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        """Yield (suffix, label string, value) for exposition."""
+        for key, (counts, total, count) in self._series.items():
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                running += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                yield "_bucket", _format_labels(self.labels, key, [("le", le)]), running
+            yield "_sum", _format_labels(self.labels, key), total
+            yield "_count", _format_labels(self.labels, key), count
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """Add a metric and return it."""
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labels=()):
+        """Create and register a Counter."""
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=(), callback=None):
+        """Create and register a Gauge."""
+        return self.register(Gauge(name, description, labels, callback))
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram."""
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for suffix, labels, value in metric.samples():
+                    lines.append(f"{metric.name}{suffix}{labels} {value}")
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to collect metric %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+command_seconds = registry.histogram(
+    "skywatcher_command_seconds", "End-to-end interaction latency.", ("command", "status"))
+stage_seconds = registry.histogram(
+    "skywatcher_stage_seconds", "Latency of each stage of a command.", ("command", "stage"))
+upstream_responses = registry.counter(
+    "skywatcher_upstream_responses_total", "OpenWeather responses by endpoint and status.",
+    ("endpoint", "status"))
+upstream_seconds = registry.histogram(
+    "skywatcher_upstream_seconds", "OpenWeather request latency.", ("endpoint",))
+first_response_seconds = registry.histogram(
+    "skywatcher_first_response_seconds", "Time until the user first sees a result.",
+    ("command",))
+command_timeouts = registry.counter(
+    "skywatcher_command_timeouts_total", "Commands abandoned at their deadline.", ("command",))
+prefetches = registry.counter(
+    "skywatcher_prefetches_total", "Payloads refreshed ahead of expiry for hot locations.",
+    ("endpoint",))
+event_loop_lag = registry.gauge(
+    "skywatcher_event_loop_lag_seconds", "How late the event loop ran a scheduled wakeup.")
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a block as one stage of the current command."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, command=current_command.get(), stage=name)
+        stages = current_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+async def measure_event_loop_lag(interval=1.0):
+    """Continuously record how late the loop wakes up from a fixed sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag.set(max(0.0, loop.time() - expected))
+
+async def start_http_server(host="127.0.0.1", port=9108):
+    """Serve /metrics on a local HTTP endpoint and return the runner."""
+    async def handle_metrics(_request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics available at http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,56 @@
+"""Request-frequency tracking that picks the locations worth keeping warm."""
+import time
+
+class LocationTracker:
+    """Decaying request counts per location, so recent popularity outweighs old traffic.
+
+    Each request adds one to its location's score and scores halve every half_life
+    seconds. Pinned locations, such as the custom cities, always come first.
+    """
+
+    def __init__(self, half_life=3600, precision=2, max_locations=1000):
+        self.half_life = half_life
+        self.precision = precision
+        self.max_locations = max_locations
+        # (rounded lat, rounded lon) -> (score, scored_at, lat, lon, name)
+        self._scores = {}
+        self._pinned = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def _key(self, lat, lon):
+        return round(float(lat), self.precision), round(float(lon), self.precision)
+
+    def _decayed(self, entry, now):
+        score, scored_at = entry[0], entry[1]
+        return score * 0.5 ** ((now - scored_at) / self.half_life)
+
+    def record(self, lat, lon, name, now=None):
+        """Count one request for a location."""
+        now = time.monotonic() if now is None else now
+        key = self._key(lat, lon)
+        entry = self._scores.get(key)
+        score = self._decayed(entry, now) + 1 if entry is not None else 1.0
+        self._scores[key] = (score, now, lat, lon, name)
+        if len(self._scores) > self.max_locations:
+            coldest = min(self._scores, key=lambda k: self._decayed(self._scores[k], now))
+            del self._scores[coldest]
+
+    def pin(self, locations):
+        """Replace the pinned locations with (lat, lon, name) tuples."""
+        self._pinned = {self._key(lat, lon): (lat, lon, name) for lat, lon, name in locations}
+
+    def hot(self, limit, min_score=1.0, now=None):
+        """Return (lat, lon, name) of every pinned location, then of up to limit others.
+
+        The others are the hottest locations with a decayed score of at least min_score.
+        """
+        now = time.monotonic() if now is None else now
+        ranked = sorted(
+            ((self._decayed(entry, now), key) for key, entry in self._scores.items() \
+                if key not in self._pinned),
+            reverse=True
+        )
+        hottest = [self._scores[key][2:] for score, key in ranked if score >= min_score]
+        return list(self._pinned.values()) + hottest[:limit]
@@ -0,0 +1,113 @@
+"""Deferred, progressive interaction responses with per-stage timing and deadlines."""
+import time
+import asyncio
+import logging
+import metrics
+
+logger = logging.getLogger('discord_bot')
+
+class ResponsePipeline:
+    """Acknowledges an interaction at once, then delivers results as they become ready.
+
+    Discord fails an interaction that isn't acknowledged within 3 seconds, so entering
+    the pipeline defers straight away. The first send() fills in the deferred message,
+    attach() adds a chart or map to it later and further sends become followups. A
+    command still running at its deadline is cancelled and the user is told so.
+
+        async with ResponsePipeline(interaction, timeout=30) as response:
+            await response.send(embed=embed)
+            await response.attach(await render(...), embed)
+    """
+
+    def __init__(self, interaction, timeout=None, timeout_message=None, slow_seconds=None):
+        self.interaction = interaction
+        self.timeout = timeout
+        self.timeout_message = timeout_message or \
+            "This is taking longer than expected. Please try again later."
+        self.slow_seconds = slow_seconds
+        self.stages = {}
+        self.timed_out = False
+        # Whether the user has seen a result yet (beyond the thinking indicator)
+        self.sent = False
+        self._started = None
+        self._task = None
+        self._watchdog = None
+        self._stages_token = None
+
+    @property
+    def command(self):
+        """Name of the command being answered, as used for metric labels."""
+        return metrics.current_command.get()
+
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        self._stages_token = metrics.current_stages.set(self.stages)
+        self._task = asyncio.current_task()
+        if self.timeout:
+            self._watchdog = asyncio.get_running_loop().call_later(self.timeout, self._expire)
+        await self.defer()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        metrics.current_stages.reset(self._stages_token)
+        elapsed = time.perf_counter() - self._started
+        if self.slow_seconds is not None and elapsed > self.slow_seconds:
+            logger.warning("Slow /%s took %.2fs: %s", self.command, elapsed, ", ".join(
+                f"{name} {seconds:.2f}s" for name, seconds in self.stages.items()) or "no stages")
+
+        if exc_type is asyncio.CancelledError and self.timed_out:
+            # Our own deadline, not a shutdown: swallow the cancellation and say so
+            if hasattr(self._task, "uncancel"):
+                self._task.uncancel()
+            metrics.command_timeouts.inc(command=self.command)
+            logger.warning("/%s timed out after %ss", self.command, self.timeout)
+            await self.send(self.timeout_message)
+            return True
+        return False
+
+    def _expire(self):
+        self.timed_out = True
+        self._task.cancel()
+
+    async def defer(self):
+        """Acknowledge the interaction so Discord shows a thinking state instead of failing."""
+        if not self.interaction.response.is_done():
+            with metrics.stage("defer"):
+                await self.interaction.response.defer(thinking=True)
+
+    async def send(self, content=None, *, embed=None, file=None, view=None):
+        """Fill in the deferred message on the first call, post followups after that."""
+        kwargs = {"content": content, "embed": embed}
+        if view is not None:
+            kwargs["view"] = view
+        if not self.interaction.response.is_done():
+            if file is not None:
+                kwargs["file"] = file
+            await self.interaction.response.send_message(**kwargs)
+        elif not self.sent:
+            await self.interaction.edit_original_response(
+                attachments=[file] if file is not None else [], **kwargs)
+        else:
+            if file is not None:
+                kwargs["file"] = file
+            await self.interaction.followup.send(**{k: v for k, v in kwargs.items() \
+                if v is not None})
+            return
+        if not self.sent:
+            self.sent = True
+            metrics.first_response_seconds.observe(time.perf_counter() - self._started,
+                                                   command=self.command)
+
+    async def attach(self, file, embed=None):
+        """Add a rendered image to the message already sent, showing it inside embed if given."""
+        if embed is not None:
+            embed.set_image(url="attachment://" + file.filename)
+        with metrics.stage("upload"):
+            if not self.sent:
+                await self.send(embed=embed, file=file)
+            elif embed is not None:
+                await self.interaction.edit_original_response(embed=embed, attachments=[file])
+            else:
+                await self.interaction.edit_original_response(attachments=[file])
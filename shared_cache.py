@@ -0,0 +1,151 @@
+"""Cache shared by every bot process on a host, backed by SQLite in WAL mode."""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+class SharedCache:
+    """Namespaced byte-string cache with expiry and fetch leases, usable from many processes.
+
+    WAL mode lets readers in every shard process proceed while one of them writes, and
+    leases let one process fetch a missing key while the others wait for its result.
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, owner INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def encode_key(key):
+        """Turn a tuple or string key into the text stored in the database."""
+        return key if isinstance(key, str) else json.dumps(key, default=str)
+
+    def get(self, namespace, key, allow_stale=False):
+        """Return (value, seconds_left) for key, or None if missing (or expired, unless allowed)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, self.encode_key(key))
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        value, expires_at = row
+        seconds_left = expires_at - time.time()
+        if seconds_left <= 0:
+            if not allow_stale:
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return value, seconds_left
+
+    def set(self, namespace, key, value, ttl):
+        """Store value under key for ttl seconds."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (namespace, self.encode_key(key), value, time.time() + ttl)
+            )
+            self._conn.commit()
+
+    def try_lease(self, namespace, key, seconds):
+        """Claim the right to fetch key for a while; returns False if another process holds it."""
+        now = time.time()
+        encoded = self.encode_key(key)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, encoded, now)
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO leases VALUES (?, ?, ?, ?)",
+                (namespace, encoded, os.getpid(), now + seconds)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def leased(self, namespace, key):
+        """Whether some process currently holds an unexpired lease on key."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM leases WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, self.encode_key(key), time.time())
+            ).fetchone()
+        return row is not None
+
+    def release(self, namespace, key):
+        """Give up this process's lease on key."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?",
+                (namespace, self.encode_key(key), os.getpid())
+            )
+            self._conn.commit()
+
+    def purge(self, stale_grace=0):
+        """Delete entries that expired more than stale_grace seconds ago; returns the count."""
+        cutoff = time.time() - stale_grace
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (cutoff,))
+            self._conn.execute("DELETE FROM leases WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        """Drop every entry and lease while keeping the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM leases")
+            self._conn.commit()
+
+    @property
+    def hit_rate(self):
+        """Share of this process's lookups that found a fresh entry; reads no database."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored entries per namespace.
+
+        Counts entries with a query that takes the database lock, so call it from a
+        worker thread.
+        """
+        with self._lock:
+            sizes = dict(self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM entries GROUP BY namespace"
+            ).fetchall())
+        return {
+            "size": sizes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate": self.hit_rate
+        }
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,433 @@
+"""HURDAT2 storm archive, loaded in the background and snapshotted to disk as typed arrays."""
+import os
+import json
+import time
+import shutil
+import asyncio
+import difflib
+import logging
+import datetime
+import tempfile
+from itertools import chain
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger('discord_bot')
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Stored in the int16 wind and pressure columns where a reading is missing
+MISSING = -1
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def to_minutes(moment):
+    """Minutes since the epoch of a date, datetime or datetime64."""
+    return int(np.datetime64(moment, 'm').astype(np.int64))
+
+def to_datetime(minutes):
+    """Inverse of to_minutes, as a naive datetime."""
+    return EPOCH + datetime.timedelta(minutes=int(minutes))
+
+# Categories from storm_category(), weakest first
+CATEGORIES = ("Tropical Depression", "Tropical Storm", "Hurricane", "Major Hurricane")
+
+def storm_category(max_wind):
+    """Classify a storm by its peak wind speed."""
+    return "Tropical Depression" if max_wind < 39 else \
+        "Tropical Storm" if max_wind < 74 else \
+        "Hurricane" if max_wind < 113 else \
+        "Major Hurricane"
+
+class StormIndex:
+    """Columnar per-storm summary table computed once from the track points of every storm."""
+
+    def __init__(self, points):
+        storms = points.storms
+        starts, ends = points.offsets[:-1], points.offsets[1:] - 1
+
+        self.ids = np.array([storm['id'] for storm in storms], dtype=object)
+        self.names = np.array([storm['name'].upper() for storm in storms], dtype=object)
+        self.years = np.array([storm['year'] for storm in storms], dtype=np.int16)
+        self.ace = np.array([storm.get('ace', np.nan) for storm in storms], dtype=float)
+        # Every storm has at least one point, so each reduceat segment is non-empty
+        with np.errstate(invalid='ignore'):
+            self.max_wind = np.fmax.reduceat(points.wind(), starts) if len(storms) else \
+                np.empty(0)
+            self.min_pressure = np.fmin.reduceat(points.pressure(), starts) if len(storms) else \
+                np.empty(0)
+        self.start = points.minutes[starts].astype('datetime64[m]')
+        self.end = points.minutes[ends].astype('datetime64[m]')
+
+        self.duration_days = (self.end - self.start).astype('timedelta64[D]').astype(int)
+        self.categories = np.array(
+            [storm_category(wind) if np.isfinite(wind) else "Unknown" for wind in self.max_wind],
+            dtype=object
+        )
+        # Position in CATEGORIES, -1 when the peak wind is unknown
+        self.category_codes = np.array(
+            [CATEGORIES.index(category) if category in CATEGORIES else -1 \
+                for category in self.categories], dtype=np.int8
+        )
+
+        self._rows_by_id = {storm_id: row for row, storm_id in enumerate(self.ids)}
+        # (NAME, year) -> rows; unnamed storms can share a name within a season
+        self._by_name_year = {}
+        for row, key in enumerate(zip(self.names, self.years.tolist())):
+            self._by_name_year.setdefault(key, []).append(row)
+        self._known_names = sorted(set(self.names))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def summary(self, row):
+        """Return the precomputed summary for one row as a dict."""
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "year": int(self.years[row]),
+            "max_wind": self.max_wind[row],
+            "min_pressure": self.min_pressure[row],
+            "start": self.start[row].astype(object),
+            "end": self.end[row].astype(object),
+            "duration_days": int(self.duration_days[row]),
+            "ace": self.ace[row],
+            "category": self.categories[row]
+        }
+
+    def row_of(self, storm_id):
+        """Return the row of a storm ID, or None if it isn't in the archive."""
+        return self._rows_by_id.get(storm_id)
+
+    def lookup(self, name, year):
+        """Return the summary of the storm with this name and year, or None."""
+        rows = self._by_name_year.get((name.upper(), int(year)))
+        if not rows:
+            return None
+        # Prefer the strongest if a name repeats within a season
+        row = max(rows, key=lambda r: np.nan_to_num(self.max_wind[r], nan=-1))
+        return self.summary(row)
+
+    def season(self, year):
+        """Return summaries of every storm in a season, in chronological order."""
+        rows = np.flatnonzero(self.years == int(year))
+        rows = rows[np.argsort(self.start[rows])]
+        return [self.summary(row) for row in rows]
+
+    def notable(self, limit=25):
+        """Return row indices of the most notable storms by ACE and peak wind."""
+        by_ace = np.argsort(-np.nan_to_num(self.ace, nan=-1.0), kind='stable')
+        by_wind = np.argsort(-np.nan_to_num(self.max_wind, nan=-1.0), kind='stable')
+        rows = []
+        for row in np.ravel(np.column_stack((by_ace, by_wind))):
+            if row not in rows:
+                rows.append(int(row))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def season_stats(self, first_year, last_year=None):
+        """Return (years, ace, counts) for a range of seasons.
+
+        ace holds the total ACE of each season and counts the number of storms of each
+        of CATEGORIES per season, one row per year. The range is clamped to the seasons
+        on record, so the arrays are empty when it doesn't overlap them.
+        """
+        last_year = first_year if last_year is None else last_year
+        first_year = max(int(first_year), int(self.years.min()))
+        last_year = min(int(last_year), int(self.years.max()))
+        if last_year < first_year:
+            return (np.empty(0, dtype=np.int64), np.empty(0),
+                    np.empty((0, len(CATEGORIES)), dtype=np.int64))
+        mask = (self.years >= first_year) & (self.years <= last_year)
+        offsets = self.years[mask].astype(np.intp) - first_year
+        seasons = last_year - first_year + 1
+        ace = np.bincount(offsets, weights=np.nan_to_num(self.ace[mask]), minlength=seasons)
+        codes = self.category_codes[mask]
+        known = codes >= 0
+        counts = np.bincount(offsets[known] * len(CATEGORIES) + codes[known],
+                             minlength=seasons * len(CATEGORIES)).reshape(seasons, len(CATEGORIES))
+        return np.arange(first_year, last_year + 1), ace, counts
+
+    def strongest(self, first_year, last_year=None, limit=5):
+        """Return rows of the storms with the highest peak wind in a range of seasons."""
+        last_year = first_year if last_year is None else last_year
+        rows = np.flatnonzero((self.years >= first_year) & (self.years <= last_year) &
+                              np.isfinite(self.max_wind))
+        return rows[np.argsort(-self.max_wind[rows], kind='stable')[:limit]]
+
+    def suggest(self, name, year=None, limit=3):
+        """Return close name matches, restricted to one season when year is given."""
+        if year is not None:
+            candidates = sorted(set(self.names[self.years == int(year)]))
+        else:
+            candidates = self._known_names
+        return difflib.get_close_matches(name.upper(), candidates, n=limit, cutoff=0.6)
+
+def unit_vectors(lat, lon):
+    """Convert latitudes and longitudes in degrees to points on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+class TrackPoints:
+    """Every track point of the archive in compact typed columns, with a KD-tree over positions.
+
+    Points are stored storm by storm in StormIndex row order, so storm_row is sorted and
+    per-storm reductions are a single reduceat over a masked slice. Positions are float32,
+    wind and pressure int16 with MISSING for gaps, times int32 minutes since the epoch and
+    text fields small integer codes, so the whole basin takes about 20 bytes per point
+    instead of the dicts of lists a TrackDataset keeps. The columns are saved as .npy files
+    and memory-mapped back, so shard processes share one copy through the page cache.
+
+    The tree holds 3D unit vectors, where the straight-line distance maps exactly to the
+    great-circle distance.
+    """
+
+    # Per-point numeric columns and their on-disk dtypes
+    COLUMNS = {"minutes": np.int32, "lat": np.float32, "lon": np.float32, "vmax": np.int16,
+               "mslp": np.int16, "type": np.int8, "wmo_basin": np.int8, "special": np.int8,
+               "extra_obs": np.int8}
+    # Per-point text fields, stored as codes into a vocabulary
+    CODED = ("type", "wmo_basin", "special")
+
+    def __init__(self, columns, offsets, storms, vocabularies):
+        self.offsets = offsets
+        self.storms = storms
+        self.vocabularies = vocabularies
+        self.minutes = columns["minutes"]
+        self.lat = columns["lat"]
+        self.lon = columns["lon"]
+        self.vmax = columns["vmax"]
+        self.mslp = columns["mslp"]
+        self.codes = {name: columns[name] for name in self.CODED}
+        self.extra_obs = columns["extra_obs"]
+        self.storm_row = np.repeat(np.arange(len(storms), dtype=np.int32), np.diff(offsets))
+
+        located = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        self._tree_points = located
+        self._tree = cKDTree(unit_vectors(self.lat[located], self.lon[located]))
+
+    @classmethod
+    def from_storm_data(cls, storm_data):
+        """Pack the dict-of-lists storms of a TrackDataset into typed columns."""
+        storms = list(storm_data.values())
+        lengths = np.array([len(storm['time']) for storm in storms], dtype=np.int64)
+        total = int(lengths.sum())
+
+        def values(key):
+            return chain.from_iterable(storm[key] for storm in storms)
+
+        def measure(key):
+            readings = np.fromiter(values(key), dtype=float, count=total)
+            return np.where(np.isfinite(readings), np.round(readings), MISSING).astype(np.int16)
+
+        columns = {
+            "minutes": np.array(list(values('time')), dtype='datetime64[m]').reshape(total)
+                         .astype(np.int64).astype(np.int32),
+            "lat": np.fromiter(values('lat'), dtype=np.float32, count=total),
+            "lon": np.fromiter(values('lon'), dtype=np.float32, count=total),
+            "vmax": measure('vmax'),
+            "mslp": measure('mslp'),
+            "extra_obs": np.fromiter(values('extra_obs'), dtype=np.int8, count=total)
+        }
+        vocabularies = {}
+        for name in cls.CODED:
+            vocabulary, codes = np.unique(np.array(list(values(name)), dtype=str),
+                                          return_inverse=True)
+            if len(vocabulary) > np.iinfo(np.int8).max:
+                raise ValueError(f"too many distinct {name} values to code")
+            vocabularies[name] = vocabulary.tolist()
+            columns[name] = codes.astype(np.int8).reshape(total)
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        # Scalar fields stay as plain JSON-friendly values
+        meta = tuple({key: value.item() if isinstance(value, np.generic) else value \
+            for key, value in storm.items() if not isinstance(value, (list, np.ndarray))}
+            for storm in storms)
+        return cls(columns, offsets, meta, vocabularies)
+
+    def save(self, directory):
+        """Atomically replace directory with .npy files of the columns and a JSON index."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix=".storms-")
+        for name in self.COLUMNS:
+            column = self.codes[name] if name in self.CODED else getattr(self, name)
+            np.save(os.path.join(staging, f"{name}.npy"), column)
+        np.save(os.path.join(staging, "offsets.npy"), self.offsets)
+        with open(os.path.join(staging, "storms.json"), 'w', encoding='utf-8') as index_file:
+            json.dump({"storms": self.storms, "vocabularies": self.vocabularies}, index_file)
+
+        retired = None
+        if os.path.exists(directory):
+            retired = tempfile.mkdtemp(dir=parent, prefix=".storms-old-")
+            os.replace(directory, os.path.join(retired, "snapshot"))
+        os.replace(staging, directory)
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory):
+        """Memory-map a snapshot written by save()."""
+        with open(os.path.join(directory, "storms.json"), 'r', encoding='utf-8') as index_file:
+            index = json.load(index_file)
+        columns = {}
+        for name, dtype in cls.COLUMNS.items():
+            columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            if columns[name].dtype != dtype:
+                raise ValueError(f"{name} column has dtype {columns[name].dtype}, not {dtype}")
+        offsets = np.load(os.path.join(directory, "offsets.npy"))
+        if offsets[-1] != len(columns["minutes"]):
+            raise ValueError("storm offsets don't match the number of track points")
+        return cls(columns, offsets, tuple(index["storms"]), index["vocabularies"])
+
+    def __len__(self):
+        return len(self.storm_row)
+
+    def wind(self, points=slice(None)):
+        """Maximum sustained wind of points in knots as floats, NaN where missing."""
+        vmax = self.vmax[points]
+        return np.where(vmax == MISSING, np.nan, vmax.astype(float))
+
+    def pressure(self, points=slice(None)):
+        """Minimum pressure of points in hPa as floats, NaN where missing."""
+        mslp = self.mslp[points]
+        return np.where(mslp == MISSING, np.nan, mslp.astype(float))
+
+    def timestamp(self, point):
+        """Time of one point as a datetime."""
+        return to_datetime(self.minutes[point])
+
+    def storm_dict(self, row):
+        """Rebuild the TrackDataset-style dict of one storm, e.g. for tropycal's plotting."""
+        points = slice(int(self.offsets[row]), int(self.offsets[row + 1]))
+        storm = dict(self.storms[row])
+        storm['time'] = [to_datetime(minutes) for minutes in self.minutes[points]]
+        # float32 positions round-trip to the 0.01 degree precision of the source data
+        storm['lat'] = np.round(self.lat[points].astype(float), 2).tolist()
+        storm['lon'] = np.round(self.lon[points].astype(float), 2).tolist()
+        storm['vmax'] = self.wind(points).tolist()
+        storm['mslp'] = self.pressure(points).tolist()
+        for name in self.CODED:
+            vocabulary = self.vocabularies[name]
+            storm[name] = [vocabulary[code] for code in self.codes[name][points]]
+        storm['extra_obs'] = self.extra_obs[points].tolist()
+        return storm
+
+    def strongest(self, start, end, limit=10):
+        """Return (rows, peak_winds) of the storms with the highest winds between start and end.
+
+        Only track points inside the window count, so a storm that peaked outside it is
+        ranked by its strongest point within.
+        """
+        start, end = to_minutes(start), to_minutes(end)
+        points = np.flatnonzero((self.minutes >= start) & (self.minutes <= end) &
+                                (self.vmax != MISSING))
+        if not len(points):
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        rows, first = np.unique(self.storm_row[points], return_index=True)
+        peaks = np.maximum.reduceat(self.vmax[points], first).astype(float)
+        order = np.argsort(-peaks, kind='stable')[:limit]
+        return rows[order], peaks[order]
+
+    def near(self, lat, lon, radius_km, storm_mask=None, limit=10):
+        """Find storms whose track came within radius_km of a point.
+
+        storm_mask optionally restricts the search to some StormIndex rows. Returns
+        (rows, distances_km, points, total): the closest storms first with their closest
+        approach and the track point where it happened, plus how many storms matched.
+        """
+        angle = min(radius_km / EARTH_RADIUS_KM, np.pi)
+        target = unit_vectors([lat], [lon])[0]
+        hits = np.asarray(self._tree.query_ball_point(target, 2 * np.sin(angle / 2)),
+                          dtype=np.intp)
+        if storm_mask is not None:
+            hits = hits[storm_mask[self.storm_row[self._tree_points[hits]]]]
+        if not len(hits):
+            return np.empty(0, dtype=np.int32), np.empty(0), np.empty(0, dtype=np.intp), 0
+
+        points = self._tree_points[hits]
+        chord = np.linalg.norm(self._tree.data[hits] - target, axis=1)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+        # Sort by storm, then distance, so the first point of each storm is its closest
+        order = np.lexsort((distances, self.storm_row[points]))
+        rows, first = np.unique(self.storm_row[points[order]], return_index=True)
+        closest = order[first]
+        ranked = np.argsort(distances[closest], kind='stable')[:limit]
+        return rows[ranked], distances[closest][ranked], points[closest][ranked], len(rows)
+
+class StormArchive:
+    """Lazily loaded storm tracks, reused from a memory-mapped snapshot across restarts."""
+
+    def __init__(self, basin='north_atlantic', snapshot_dir='data/north_atlantic',
+                 max_age_days=30):
+        self.basin = basin
+        self.snapshot_dir = snapshot_dir
+        self.max_age_days = max_age_days
+        self.points = None
+        self.index = None
+        self._task = None
+
+    @property
+    def ready(self):
+        """Whether the track points and their summary index have finished loading."""
+        return self.points is not None and self.index is not None
+
+    def _snapshot_age_days(self):
+        """Age of the snapshot in days, or None if there is no snapshot."""
+        index_path = os.path.join(self.snapshot_dir, "storms.json")
+        if not os.path.exists(index_path):
+            return None
+        return (time.time() - os.path.getmtime(index_path)) / 86400
+
+    def load(self):
+        """Blocking load: a fresh snapshot if available, otherwise download and snapshot."""
+        age = self._snapshot_age_days()
+        if age is not None and age <= self.max_age_days:
+            try:
+                return TrackPoints.open(self.snapshot_dir)
+            except (OSError, ValueError, KeyError) as err:
+                logger.warning("Ignoring unreadable storm snapshot: %s", err)
+
+        # tropycal is heavy and only needed for a download, so the snapshot path skips it
+        import tropycal.tracks as tracks  # pylint: disable=import-outside-toplevel
+        try:
+            dataset = tracks.TrackDataset(basin=self.basin)
+        except Exception:  # pylint: disable=broad-except
+            if age is None:
+                raise
+            logger.warning("Storm download failed, falling back to %.0f day old snapshot", age)
+            return TrackPoints.open(self.snapshot_dir)
+
+        TrackPoints.from_storm_data(dataset.data).save(self.snapshot_dir)
+        # Serve from the memory-mapped copy so neither the dataset nor the packed
+        # columns stay resident
+        del dataset
+        return TrackPoints.open(self.snapshot_dir)
+
+    def start(self):
+        """Begin loading in a background thread if not already loaded or loading."""
+        if self.ready or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._load_in_background())
+
+    async def wait_ready(self):
+        """Wait for the current load attempt and return whether the archive is ready."""
+        self.start()
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        return self.ready
+
+    async def _load_in_background(self):
+        started = time.perf_counter()
+        try:
+            points = await asyncio.to_thread(self.load)
+            self.index = await asyncio.to_thread(StormIndex, points)
+            self.points = points
+            logger.info("Storm archive ready in %.1fs: %d storms, %d track points.",
+                        time.perf_counter() - started, len(self.index), len(points))
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to load storm archive")
+        finally:
+            self._task = None
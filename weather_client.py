@@ -0,0 +1,217 @@
+"""Async OpenWeather HTTP client shared by all SKYWATCHER commands."""
+import time
+import heapq
+import asyncio
+import datetime
+import itertools
+import logging
+import aiohttp
+
+logger = logging.getLogger('discord_bot')
+
+class RateLimitExceeded(Exception):
+    """Raised when the API key's per-minute or daily budget cannot serve a request."""
+
+class RateLimiter:
+    """Token bucket with a per-minute rate, a daily budget and a priority wait queue.
+
+    Lower priority numbers are served first; waiters of equal priority are served in
+    arrival order.
+    """
+
+    def __init__(self, per_minute=60, per_day=30000):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._day = datetime.datetime.now(datetime.timezone.utc).date()
+        self.used_today = 0
+        self.rejected = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.per_minute,
+                           self._tokens + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def _roll_day(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self._day:
+            self._day = today
+            self.used_today = 0
+
+    def _available(self):
+        return self._tokens >= 1 and time.monotonic() >= self._blocked_until
+
+    def _take(self):
+        self._tokens -= 1
+        self.used_today += 1
+
+    def _seconds_until_token(self):
+        refill = max(0.0, (1 - self._tokens) * 60 / self.per_minute)
+        return max(refill, self._blocked_until - time.monotonic())
+
+    def _schedule_drain(self):
+        if self._wakeup is None and self._waiters:
+            loop = asyncio.get_running_loop()
+            self._wakeup = loop.call_later(self._seconds_until_token(), self._drain)
+
+    def _drain(self):
+        """Hand available tokens to the highest-priority waiters."""
+        self._wakeup = None
+        self._refill()
+        self._roll_day()
+        while self._waiters and self._available():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            if self.used_today >= self.per_day:
+                future.set_exception(RateLimitExceeded("daily API budget exhausted"))
+                continue
+            self._take()
+            future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._schedule_drain()
+
+    def daily_exhausted(self):
+        """Whether today's budget is used up."""
+        self._roll_day()
+        return self.used_today >= self.per_day
+
+    def would_wait(self):
+        """Whether a new request could not be granted a token immediately."""
+        self._refill()
+        return bool(self._waiters) or not self._available() or self.daily_exhausted()
+
+    async def acquire(self, priority=1, timeout=None):
+        """Wait for a token, raising RateLimitExceeded if none is granted within timeout."""
+        if self.daily_exhausted():
+            self.rejected += 1
+            raise RateLimitExceeded("daily API budget exhausted")
+        self._refill()
+        if not self._waiters and self._available():
+            self._take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._schedule_drain()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as exc:
+            self.rejected += 1
+            raise RateLimitExceeded("timed out waiting for an API token") from exc
+
+    def backoff(self, seconds):
+        """Stop handing out tokens for a while, e.g. after an upstream 429."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+
+    def headroom(self):
+        """Return remaining per-minute tokens and daily budget."""
+        self._refill()
+        self._roll_day()
+        return {
+            "minute_tokens": round(self._tokens, 2),
+            "per_minute": self.per_minute,
+            "daily_used": self.used_today,
+            "daily_remaining": max(0, self.per_day - self.used_today),
+            "per_day": self.per_day,
+            "queued": sum(1 for _, _, future in self._waiters if not future.done()),
+            "rejected": self.rejected
+        }
+
+class WeatherClient:
+    """Pooled keep-alive HTTP session with per-host concurrency limits."""
+
+    def __init__(self, pool_size=100, per_host_limit=20, timeout=10, limiter=None,
+                 max_queue_wait=5, on_response=None):
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_queue_wait = max_queue_wait
+        # Called as on_response(url, status, seconds) after every upstream attempt
+        self.on_response = on_response
+        self._session = None
+
+    async def start(self):
+        """Open the shared session; must be called from inside the event loop."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.per_host_limit,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        """Close the shared session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_json(self, url, params, priority=1):
+        """Fetch JSON from an API endpoint, returning None on any HTTP or network error.
+
+        Raises RateLimitExceeded when the client-side budget is spent or the API answers 429.
+        """
+        await self.start()
+        if self.limiter is not None:
+            await self.limiter.acquire(priority, self.max_queue_wait)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with self._session.get(url, params=params) as response:
+                status = response.status
+                if response.status == 429:
+                    retry_after = response.headers.get('Retry-After', '')
+                    if self.limiter is not None:
+                        self.limiter.backoff(float(retry_after) if retry_after.isdigit() else 60)
+                    raise RateLimitExceeded("OpenWeather returned 429 Too Many Requests")
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except aiohttp.ClientResponseError as http_err:
+            logger.error("HTTP error occurred: %s %s", http_err.status, http_err.message)
+        except asyncio.TimeoutError as req_err:
+            status = "timeout"
+            logger.error("Request error occurred: %r", req_err)
+        except aiohttp.ClientError as req_err:
+            logger.error("Request error occurred: %r", req_err)
+        finally:
+            if self.on_response is not None:
+                self.on_response(url, status, time.perf_counter() - started)
+        return None
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared upstream call."""
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, factory):
+        """Await factory() once per key; callers arriving while it runs share the result."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield so one caller timing out doesn't cancel the request for everyone else
+        return await asyncio.shield(future)